@@ -0,0 +1,391 @@
+"""Linguistically annotates built session files into ParlaMint `.ana` files.
+
+Every `seg` of the plain session files is tokenized, tagged, lemmatized and
+named-entity annotated with classla and written out as `<w>`/`<pc>`
+elements, with named entities as `<name>`. Sentences are annotated in
+batches across utterances and small sessions on a process pool; the
+finished sessions are recorded in a manifest, so an interrupted run
+resumes where it stopped.
+
+Example:
+    python annotate.py /home/rupnik/parlamint/BiH/S /home/rupnik/parlamint/BiH/S.ana --workers 8
+"""
+import argparse
+import os
+import re
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from tempfile import TemporaryFile
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from xml.sax.saxutils import unescape
+
+from manifest import BuildManifest, hash_file
+from utils import (assign_sentences, pretty_end_tag, pretty_start_tag,
+                   pretty_text_element)
+
+# A sentence as written by `construct_TEI`, one per line unless its text has
+# line breaks:
+_SEG_LINE = re.compile(r'(?P<indent>\t*)<seg xml:id="(?P<id>[^"]+)">(?P<text>[^<]*)</seg>$',
+                       re.DOTALL)
+_WORDS_MEASURE = re.compile(r'(<measure unit="words" quantity=")\d+'
+                            r'("[^>]*xml:lang="(?P<lang>[^"]+)"[^>]*>)([\d.,]+)')
+_TEI_ID = re.compile(r'(<TEI [^>]*xml:id="[^"]+)(")')
+
+# Elements added to the header's tagUsage:
+ANA_TAGS = ("w", "pc", "name")
+
+# (text, lemma, upos, xpos, feats, ner, space_after) of a token:
+Token = Tuple[str, str, str, str, Optional[str], Optional[str], bool]
+
+
+def get_annotation_pipeline():
+    """Returns the full classla pipeline, loading it on first use."""
+    global annotation_pipeline
+    try:
+        return annotation_pipeline
+    except NameError:
+        import classla
+        processors = "tokenize,pos,lemma,ner"
+        try:
+            annotation_pipeline = classla.Pipeline("hr", processors=processors)
+        except FileNotFoundError:
+            classla.download("hr")
+            annotation_pipeline = classla.Pipeline("hr", processors=processors)
+    return annotation_pipeline
+
+
+def ana_file_name(session_file: Union[str, Path]) -> str:
+    """`ParlaMint-BA_T07S12n.xml` -> `ParlaMint-BA_T07S12n.ana.xml`"""
+    return Path(session_file).stem + ".ana.xml"
+
+
+def _sentence_tokens(sentence) -> List[Token]:
+    tokens = []
+    for token in sentence.tokens:
+        space_after = "SpaceAfter=No" not in (token.misc or "")
+        for i, word in enumerate(token.words):
+            last = i == len(token.words) - 1
+            tokens.append((word.text, word.lemma, word.upos, word.xpos, word.feats,
+                           token.ner, space_after or not last))
+    return tokens
+
+
+def annotate_sentences(texts: List[str]) -> List[List[Token]]:
+    """Annotates sentences with one classla call.
+
+    The sentences are joined with blank lines, so classla can't merge
+    them; if it splits one further, the tokens of the parts are put back
+    together. If the output can't be mapped back, each sentence is
+    annotated alone.
+    """
+    if not texts:
+        return []
+    pipeline = get_annotation_pipeline()
+    if not any("\n" in t for t in texts):
+        document = pipeline.process("\n\n".join(texts))
+        assigned = assign_sentences(texts, [s.text for s in document.sentences])
+        if assigned is not None:
+            sentences = iter(document.sentences)
+            return [[token for _ in parts for token in _sentence_tokens(next(sentences))]
+                    for parts in assigned]
+    return [[token for sentence in pipeline.process(t).sentences
+             for token in _sentence_tokens(sentence)] if t.strip() else []
+            for t in texts]
+
+
+def render_seg(seg_id: str, tokens: List[Token], depth: int,
+               counts: Dict[str, int]) -> str:
+    """Renders an annotated sentence as `<seg>` with `<w>`, `<pc>` and `<name>`."""
+    lines = [pretty_start_tag("seg", [("xml:id", seg_id)], depth)]
+    entity = None
+    for n, (text, lemma, upos, xpos, feats, ner, space_after) in enumerate(tokens, 1):
+        ner = ner or "O"
+        if entity is not None and not ner.startswith("I-"):
+            lines.append(pretty_end_tag("name", depth + 1))
+            entity = None
+        if entity is None and ner != "O":
+            entity = ner[2:]
+            lines.append(pretty_start_tag("name", [("type", entity)], depth + 1))
+            counts["name"] += 1
+        msd = f"UPosTag={upos}" + (f"|{feats}" if feats else "")
+        tag = "pc" if upos == "PUNCT" else "w"
+        attributes = [("xml:id", f"{seg_id}.{n}")]
+        if tag == "w":
+            attributes.append(("lemma", lemma))
+        attributes += [("msd", msd), ("ana", f"mte:{xpos}")]
+        if not space_after and n < len(tokens):
+            attributes.append(("join", "right"))
+        lines.append(pretty_text_element(tag, attributes, text,
+                                         depth + 1 + (entity is not None)))
+        counts[tag] += 1
+    if entity is not None:
+        lines.append(pretty_end_tag("name", depth + 1))
+    lines.append(pretty_end_tag("seg", depth))
+    return "".join(lines)
+
+
+class _AnaWriter:
+    """Writes one `.ana` file: header kept in memory, body in a temporary file.
+
+    The header's `tagUsage`, word `extent` (the number of `w`) and
+    `TEI/@xml:id` can only be finished once the whole body has been written.
+    """
+
+    def __init__(self, out_file: Path) -> None:
+        self.out_file = out_file
+        self.header: List[str] = []
+        self.body = TemporaryFile("w+", encoding="utf-8")
+        self.in_body = False
+        self.counts = {tag: 0 for tag in ANA_TAGS}
+
+    def write_line(self, line: str) -> None:
+        self.in_body |= line.lstrip().startswith("<text")
+        if self.in_body:
+            self.body.write(line)
+        else:
+            self.header.append(line)
+
+    def _words_measure(self, match: re.Match) -> str:
+        # Thousands separator of the language, as in `construct_TEI`:
+        words = f"{self.counts['w']:,d}"
+        separator = "," if match.group("lang") == "en" else "."
+        return f"{match.group(1)}{self.counts['w']}{match.group(2)}" \
+            f"{words.replace(',', separator)}"
+
+    def close(self) -> None:
+        tmp = self.out_file.with_name(self.out_file.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for line in self.header:
+                if "</namespace>" in line:
+                    indent = "\t" * (line.count("\t") + 1)
+                    for tag in ANA_TAGS:
+                        f.write(f'{indent}<tagUsage gi="{tag}" occurs="{self.counts[tag]}"/>\n')
+                line = _WORDS_MEASURE.sub(self._words_measure, line)
+                f.write(_TEI_ID.sub(r"\1.ana\2", line, count=1))
+            self.body.seek(0)
+            while True:
+                block = self.body.read(1024 * 1024)
+                if not block:
+                    break
+                f.write(block)
+        self.body.close()
+        tmp.replace(self.out_file)
+
+
+def _iter_lines(session_files: List[Path]) -> Iterator[Tuple[int, str]]:
+    for i, path in enumerate(session_files):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                yield i, line if line.endswith("\n") else line + "\n"
+        yield i, None
+
+
+def annotate_sessions(session_files: List[Union[str, Path]], outdir: Union[str, Path],
+                      batch_size: int = 512) -> List[Path]:
+    """Writes `.ana` files for several sessions, batching sentences across them.
+
+    Lines are streamed from the session files and sentences are sent to
+    classla `batch_size` at a time, so memory doesn't grow with the size of
+    the sessions. Each output is written to a temporary file first and only
+    renamed once complete. A `seg` whose text has line breaks is read up to
+    its `</seg>` and annotated like the others.
+
+    Args:
+        session_files (List[Union[str, Path]]): plain session files, as
+            written by `construct_TEI`
+        outdir (Union[str, Path]): output directory
+        batch_size (int, optional): sentences per classla call. Defaults to 512.
+
+    Returns:
+        List[Path]: written files, in the order of `session_files`.
+
+    Raises:
+        ValueError: for a `seg` that isn't plain text, e.g. in an already
+            annotated file.
+    """
+    session_files = [Path(f) for f in session_files]
+    # Opened on the first line of each session:
+    writers: Dict[int, _AnaWriter] = {}
+    # Lines waiting for their batch to be annotated, as (session, line, seg):
+    pending: List[Tuple[int, Optional[str], Optional[re.Match]]] = []
+    texts: List[str] = []
+
+    def flush() -> None:
+        annotated = iter(annotate_sentences(texts))
+        for i, line, seg in pending:
+            if i not in writers:
+                writers[i] = _AnaWriter(Path(outdir) / ana_file_name(session_files[i]))
+            writer = writers[i]
+            if line is None:
+                writer.close()
+            elif seg is None:
+                writer.write_line(line)
+            else:
+                writer.write_line(render_seg(seg.group("id"), next(annotated),
+                                             len(seg.group("indent")), writer.counts))
+        pending.clear()
+        texts.clear()
+
+    # Lines of a `seg` spanning several lines, until its `</seg>`:
+    partial: List[str] = []
+    for i, line in _iter_lines(session_files):
+        if line is not None and (partial or line.lstrip().startswith("<seg")):
+            partial.append(line)
+            if not line.rstrip().endswith("</seg>"):
+                continue
+            line, partial = "".join(partial), []
+        elif partial:
+            raise ValueError(f"Unterminated seg in {session_files[i].name}: "
+                             f"{partial[0].strip()[:80]}")
+        seg = _SEG_LINE.match(line) if line is not None else None
+        if seg is None and line is not None and line.lstrip().startswith("<seg"):
+            raise ValueError(f"Can't annotate seg in {session_files[i].name}: "
+                             f"{line.strip()[:80]}")
+        pending.append((i, line, seg))
+        if seg is not None:
+            # classla would take a line break for a paragraph break:
+            texts.append(unescape(seg.group("text"), {"&quot;": '"'}).replace("\n", " "))
+            if len(texts) == batch_size:
+                flush()
+    flush()
+    return [writers[i].out_file for i in range(len(session_files))]
+
+
+def init_worker() -> None:
+    # classla runs torch on the CPU; one thread per worker process avoids
+    # oversubscribing the cores:
+    import torch
+    torch.set_num_threads(1)
+    get_annotation_pipeline()
+
+
+def _annotate_group(session_files: List[Path], outdir: Union[str, Path],
+                    batch_size: int) -> Dict:
+    result = {"sessions": [f.name for f in session_files], "error": None}
+    try:
+        annotate_sessions(session_files, outdir, batch_size)
+    except Exception:
+        result["error"] = traceback.format_exc()
+    return result
+
+
+def group_sessions(session_files: List[Path], group_bytes: int) -> List[List[Path]]:
+    """Packs sessions into groups of up to `group_bytes`, largest first.
+
+    Sessions bigger than `group_bytes` get a group of their own; small ones
+    share one, so their sentences fill the same batches.
+    """
+    groups, current, size = [], [], 0
+    for f in sorted(session_files, key=lambda f: f.stat().st_size, reverse=True):
+        if current and size + f.stat().st_size > group_bytes:
+            groups.append(current)
+            current, size = [], 0
+        current.append(f)
+        size += f.stat().st_size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def annotation_inputs(session_file: Path) -> Dict[str, str]:
+    from segmentation_cache import get_model_version
+    return {"session": hash_file(session_file), "code": hash_file(__file__),
+            "model": get_model_version()}
+
+
+def annotate_corpus(session_dir: Union[str, Path], outdir: Union[str, Path],
+                    max_workers: int = 8, batch_size: int = 512,
+                    group_bytes: int = 8 * 1024**2,
+                    manifest_path: Optional[Union[str, Path]] = None) -> List[Dict]:
+    """Annotates all sessions on a process pool, skipping finished ones.
+
+    A session counts as finished if the manifest has it with the same
+    session file, annotation code and classla version and its `.ana` file
+    exists. The manifest is saved after every group, so killing the run
+    loses at most the groups in progress. A group whose worker fails to
+    start or dies is recorded as failed, and the others go on.
+
+    Args:
+        session_dir (Union[str, Path]): directory with the plain session files
+        outdir (Union[str, Path]): output directory for the `.ana` files
+        max_workers (int, optional): number of processes. Defaults to 8.
+        batch_size (int, optional): sentences per classla call. Defaults to 512.
+        group_bytes (int, optional): size up to which small sessions are
+            annotated together. Defaults to 8 MiB.
+        manifest_path (Union[str, Path], optional): Defaults to
+            `annotation_manifest.json` in `outdir`.
+
+    Returns:
+        List[Dict]: one result per group with its `sessions` and `error`
+            set if it failed; skipped sessions are in a group of their own
+            with `skipped` set.
+    """
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    manifest = BuildManifest(manifest_path or outdir / "annotation_manifest.json")
+    session_files = sorted(Path(session_dir).glob("ParlaMint-BA_T*.xml"))
+    inputs = {f.name: annotation_inputs(f) for f in session_files}
+    todo = [f for f in session_files
+            if manifest.outdated(f.name, inputs[f.name], outdir / ana_file_name(f))]
+    results = []
+    skipped = [f.name for f in session_files if f not in todo]
+    if skipped:
+        results.append({"sessions": skipped, "error": None, "skipped": True})
+
+    def collect(result: Dict) -> None:
+        result["skipped"] = False
+        results.append(result)
+        for name in result["sessions"]:
+            if result["error"] is None:
+                manifest.record(name, inputs[name], outdir / ana_file_name(name))
+            else:
+                manifest.forget(name)
+        manifest.save()
+
+    groups = group_sessions(todo, group_bytes)
+    if max_workers <= 1:
+        if groups:
+            try:
+                get_annotation_pipeline()
+            except Exception:
+                error = traceback.format_exc()
+                for group in groups:
+                    collect({"sessions": [f.name for f in group], "error": error})
+                return results
+        for group in groups:
+            collect(_annotate_group(group, outdir, batch_size))
+        return results
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor:
+        futures = {executor.submit(_annotate_group, group, outdir, batch_size): group
+                   for group in groups}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception:
+                # The worker failed to start or died, e.g. BrokenProcessPool:
+                result = {"sessions": [f.name for f in futures[future]],
+                          "error": traceback.format_exc()}
+            collect(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("session_dir")
+    parser.add_argument("outdir")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--manifest", default=None)
+    args = parser.parse_args()
+
+    results = annotate_corpus(args.session_dir, args.outdir, args.workers,
+                              args.batch_size, manifest_path=args.manifest)
+    done = sum(len(r["sessions"]) for r in results
+               if r["error"] is None and not r["skipped"])
+    skipped = sum(len(r["sessions"]) for r in results if r["skipped"])
+    print(f"Annotated {done} sessions, {skipped} already done.")
+    for r in results:
+        if r["error"] is not None:
+            print(f"{', '.join(r['sessions'])} failed:\n{r['error']}")
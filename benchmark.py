@@ -0,0 +1,381 @@
+"""Timing comparisons for the pipeline stages.
+
+`suite` times and memory-profiles every stage on a synthetic corpus (see
+`synthetic.py`) and stores the results as JSON; `compare` lists the stages
+that got slower or bigger between two such results.
+
+Example:
+    python benchmark.py segmentation /home/rupnik/parlamint/BiH/BiH_T7_text.txt
+    python benchmark.py suite --stub --out results/$(git rev-parse --short HEAD).json
+    python benchmark.py compare results/old.json results/new.json
+"""
+import argparse
+import json
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import pandas as pd
+
+from utils import (build_session, construct_TEI, correct_id, correct_ids,
+                   get_pipeline, parse_text_file, prepare_interim_files,
+                   split_sentences, split_sentences_batch)
+
+
+def benchmark_segmentation(text_path: Union[str, Path],
+                           batch_size: int = 256) -> Dict[str, float]:
+    """Compares per-row, batched and rule-based sentence splitting on one text file.
+
+    The classla model is loaded before timing, so only the splitting
+    itself is measured.
+
+    Args:
+        text_path (Union[str, Path]): text file, e.g. a whole term
+        batch_size (int, optional): batch size for `split_sentences_batch`.
+            Defaults to 256.
+
+    Returns:
+        Dict[str, float]: timings in seconds, speedups, whether both classla
+            paths produced the same sentences, how many batches fell back to
+            the per-row path and how well the rules agree with them (see
+            `rule_splitter.agreement`). The agreement is None if classla is
+            replaced by `synthetic.StubPipeline`.
+    """
+    from instrumentation import record_session
+    from rule_splitter import agreement
+    from synthetic import StubPipeline
+
+    texts = parse_text_file(text_path).Text.tolist()
+    get_pipeline()
+
+    start = perf_counter()
+    per_row = [split_sentences(t) for t in texts]
+    per_row_time = perf_counter() - start
+
+    with record_session("segmentation") as recorder:
+        start = perf_counter()
+        batched = split_sentences_batch(texts, batch_size=batch_size)
+        batched_time = perf_counter() - start
+
+    start = perf_counter()
+    rules = split_sentences_batch(texts, splitter="rules")
+    rules_time = perf_counter() - start
+    rules_agreement = {"identical": None, "boundary_f1": None}
+    if not isinstance(get_pipeline(), StubPipeline):
+        rules_agreement = agreement(batched, rules)
+
+    return {
+        "utterances": len(texts),
+        "per_row_s": per_row_time,
+        "batched_s": batched_time,
+        "speedup": per_row_time / batched_time if batched_time else float("nan"),
+        "identical": per_row == batched,
+        "batches": -(-len(set(texts)) // batch_size),
+        "fallback_batches": recorder.counters["segmentation fallback batches"],
+        "rules_s": rules_time,
+        "rules_speedup": batched_time / rules_time if rules_time else float("nan"),
+        "rules_identical": rules_agreement["identical"],
+        "rules_boundary_f1": rules_agreement["boundary_f1"],
+    }
+
+
+def make_ids(n: int, seed: int = 0) -> pd.Series:
+    """Generates `n` realistic utterance IDs."""
+    import random
+    rng = random.Random(seed)
+    suffixes = ["", "", "", "n", "n2", "h", "v"]
+    return pd.Series([
+        f"ParlaMint-BA_T{rng.randint(1, 8)}.S{rng.randint(1, 120)}"
+        f"{rng.choice(suffixes)}.u{i}"
+        for i in range(n)
+    ])
+
+
+def benchmark_ids(n: int = 1_000_000, sample: int = 50_000) -> Dict[str, float]:
+    """Compares `correct_ids` on `n` IDs with `correct_id` on a sample.
+
+    `correct_id` is too slow to run on millions of IDs, so its time is
+    measured on `sample` IDs and extrapolated.
+    """
+    ids = make_ids(n)
+
+    start = perf_counter()
+    vectorized = correct_ids(ids)
+    vectorized_time = perf_counter() - start
+
+    start = perf_counter()
+    per_id = [correct_id(s) for s in ids[:sample]]
+    per_id_time = (perf_counter() - start) * n / sample
+
+    return {
+        "ids": n,
+        "per_id_s_extrapolated": per_id_time,
+        "vectorized_s": vectorized_time,
+        "speedup": per_id_time / vectorized_time,
+        "identical_on_sample": per_id == vectorized[:sample].tolist(),
+    }
+
+
+def _time_session(fused: bool, text_path: Union[str, Path],
+                  meta_path: Union[str, Path], mp_path: Union[str, Path],
+                  parties_path: Union[str, Path]) -> Dict[str, float]:
+    import resource
+    from tempfile import NamedTemporaryFile, TemporaryDirectory
+
+    from metadata import MetadataStore
+    get_pipeline()
+    metadata = MetadataStore.from_files(mp_path, parties_path)
+    with TemporaryDirectory() as tmp:
+        out_file = Path(tmp) / "session.xml"
+        start = perf_counter()
+        if fused:
+            build_session(text_path, meta_path, out_file, 7, "1", "bs", metadata)
+        else:
+            with NamedTemporaryFile() as merged_file:
+                prepare_interim_files(text_path, meta_path, None, None,
+                                      merged_file.name, metadata=metadata)
+                construct_TEI(merged_file.name, out_file, 7, "1", "bs")
+        elapsed = perf_counter() - start
+    # Kilobytes on Linux:
+    return {"s": elapsed,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def benchmark_session(text_path: Union[str, Path], meta_path: Union[str, Path],
+                      mp_path: Union[str, Path],
+                      parties_path: Union[str, Path]) -> Dict[str, float]:
+    """Compares building a session through an interim file and in memory.
+
+    Each variant runs in its own process, so the peak RSS (which includes the
+    classla model) is measured separately.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    result = {}
+    for name, fused in (("interim_file", False), ("fused", True)):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            timing = executor.submit(_time_session, fused, text_path, meta_path,
+                                     mp_path, parties_path).result()
+        for key, value in timing.items():
+            result[f"{name}_{key}"] = value
+    result["speedup"] = result["interim_file_s"] / result["fused_s"]
+    return result
+
+
+def measure(function: Callable[[], object], repeat: int = 3) -> Dict[str, float]:
+    """Times `function` and measures its peak Python memory.
+
+    The time is the best of `repeat` runs; the memory is measured with
+    `tracemalloc` in an extra run, which would distort the timings.
+    """
+    import gc
+    import tracemalloc
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"s": min(times), "runs_s": times, "peak_mb": peak / 1024**2}
+
+
+def _revision() -> Optional[str]:
+    import subprocess
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_suite(workdir: Union[str, Path], terms: Sequence[int] = (7,),
+                    sessions_per_term: int = 10, utterances_per_session: int = 500,
+                    stub: bool = True, repeat: int = 3, seed: int = 0) -> Dict:
+    """Benchmarks each pipeline stage on a synthetic corpus.
+
+    The stages run on all sessions of the corpus, one after the other, each
+    using the output of the previous ones: parsing the text and metadata
+    files, sentence splitting (per row and batched), `prepare_interim_files`,
+    `construct_TEI` with pretty-printing, `correct_id`/`correct_ids` and the
+    root TEI.
+
+    Args:
+        workdir (Union[str, Path]): where the corpus and outputs are written
+        terms (Sequence[int], optional): terms to generate. Defaults to (7,).
+        sessions_per_term (int, optional): Defaults to 10.
+        utterances_per_session (int, optional): Defaults to 500.
+        stub (bool, optional): split with `synthetic.StubPipeline` instead of
+            classla, so no model is needed. Defaults to True.
+        repeat (int, optional): timed runs per stage. Defaults to 3.
+        seed (int, optional): corpus random seed. Defaults to 0.
+
+    Returns:
+        Dict: the revision, platform and scale of the run and per stage the
+            best time `s`, all `runs_s`, `peak_mb` and the number of `items`.
+    """
+    import platform
+    from datetime import datetime
+
+    from metadata import MetadataStore
+    from root_tei import build_root_TEI
+    from speakers import SpeakerRegistry
+    from synthetic import generate_corpus, use_stub_pipeline
+    from utils import parse_meta_file
+
+    workdir = Path(workdir)
+    paths = generate_corpus(workdir, terms, sessions_per_term,
+                            utterances_per_session, seed=seed)
+    if stub:
+        use_stub_pipeline()
+    get_pipeline()
+    text_files = sorted(paths["datadir"].glob("text_*"))
+    meta_files = sorted(paths["datadir"].glob("meta_*"))
+    interim_dir, session_dir = workdir / "interim", workdir / "S"
+    interim_dir.mkdir(exist_ok=True)
+    session_dir.mkdir(exist_ok=True)
+    metadata = MetadataStore.from_files(paths["mp"], paths["parties"])
+    speakers = SpeakerRegistry.from_tables(metadata.mpdf)
+    texts = [t for f in text_files for t in parse_text_file(f).Text]
+    ids = pd.concat([parse_text_file(f).ID for f in text_files], ignore_index=True)
+
+    def interim_files():
+        for text_path, meta_path in zip(text_files, meta_files):
+            prepare_interim_files(text_path, meta_path, None, None,
+                                  interim_dir / (text_path.stem + ".parquet"),
+                                  metadata=metadata)
+
+    def session_files():
+        for i, text_path in enumerate(text_files):
+            term = int(text_path.name[6:8])
+            construct_TEI(interim_dir / (text_path.stem + ".parquet"),
+                          session_dir / f"ParlaMint-BA_T{term:02}S{i}.xml",
+                          term, str(i), "bs", speakers=speakers)
+
+    stages = {
+        "parse_text_file": (lambda: [parse_text_file(f) for f in text_files], len(texts)),
+        "parse_meta_file": (lambda: [parse_meta_file(f) for f in meta_files], len(texts)),
+        "split_sentences": (lambda: [split_sentences(t) for t in texts], len(texts)),
+        "split_sentences_batch": (lambda: split_sentences_batch(texts), len(texts)),
+        "prepare_interim_files": (interim_files, len(texts)),
+        "construct_TEI": (session_files, len(texts)),
+        "correct_id": (lambda: [correct_id(i) for i in ids], len(ids)),
+        "correct_ids": (lambda: correct_ids(ids), len(ids)),
+        "root_TEI": (lambda: build_root_TEI(
+            metadata.mpdf, metadata.partiesdf, None, session_dir,
+            paths["template"], workdir / "ParlaMint-BA.xml", additional_persons=[]),
+            len(text_files)),
+    }
+    results = {}
+    for name, (function, items) in stages.items():
+        results[name] = {**measure(function, repeat), "items": items}
+        print(f"{name}: {results[name]['s']:.3f} s, {results[name]['peak_mb']:.1f} MB")
+    return {
+        "revision": _revision(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "stub": stub,
+        "scale": {"terms": list(terms), "sessions_per_term": sessions_per_term,
+                  "utterances_per_session": utterances_per_session, "seed": seed,
+                  "utterances": len(texts)},
+        "stages": results,
+    }
+
+
+def compare_results(old: Dict, new: Dict, threshold: float = 0.1) -> List[Dict]:
+    """Compares two `benchmark_suite` results stage by stage.
+
+    Returns:
+        List[Dict]: per stage the old and new time and peak memory, their
+            ratios (new / old) and whether either grew by more than
+            `threshold`.
+    """
+    if old["scale"] != new["scale"] or old["stub"] != new["stub"]:
+        print("Warning: the results were measured at different scales.")
+    rows = []
+    for stage, new_result in new["stages"].items():
+        old_result = old["stages"].get(stage)
+        if old_result is None:
+            continue
+        time_ratio = new_result["s"] / old_result["s"] if old_result["s"] else float("nan")
+        memory_ratio = new_result["peak_mb"] / old_result["peak_mb"] \
+            if old_result["peak_mb"] else float("nan")
+        rows.append({"stage": stage, "old_s": old_result["s"], "new_s": new_result["s"],
+                     "time_ratio": time_ratio, "old_peak_mb": old_result["peak_mb"],
+                     "new_peak_mb": new_result["peak_mb"], "memory_ratio": memory_ratio,
+                     "regression": time_ratio > 1 + threshold
+                     or memory_ratio > 1 + threshold})
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    segmentation = subparsers.add_parser("segmentation")
+    segmentation.add_argument("text_path")
+    segmentation.add_argument("--batch-size", type=int, default=256)
+
+    ids = subparsers.add_parser("ids")
+    ids.add_argument("--n", type=int, default=1_000_000)
+    ids.add_argument("--sample", type=int, default=50_000)
+
+    session = subparsers.add_parser("session")
+    session.add_argument("text_path")
+    session.add_argument("meta_path")
+    session.add_argument("--mp", required=True)
+    session.add_argument("--parties", required=True)
+
+    suite = subparsers.add_parser("suite")
+    suite.add_argument("--workdir", default=None,
+                       help="where to generate the corpus, a temporary directory if not given")
+    suite.add_argument("--terms", type=int, nargs="+", default=[7])
+    suite.add_argument("--sessions", type=int, default=10)
+    suite.add_argument("--utterances", type=int, default=500)
+    suite.add_argument("--repeat", type=int, default=3)
+    suite.add_argument("--stub", action="store_true", help="split without classla")
+    suite.add_argument("--out", default=None, help="JSON file for the results")
+
+    compare = subparsers.add_parser("compare")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args()
+    if args.benchmark == "suite":
+        from tempfile import TemporaryDirectory
+        with TemporaryDirectory() as tmp:
+            result = benchmark_suite(args.workdir or tmp, args.terms, args.sessions,
+                                     args.utterances, args.stub, args.repeat)
+        if args.out is not None:
+            Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+            with open(args.out, "w") as f:
+                json.dump(result, f, indent=1)
+        raise SystemExit(0)
+    if args.benchmark == "compare":
+        with open(args.old) as f, open(args.new) as g:
+            rows = compare_results(json.load(f), json.load(g), args.threshold)
+        for row in rows:
+            print(f"{row['stage']}: {row['old_s']:.3f} -> {row['new_s']:.3f} s "
+                  f"(x{row['time_ratio']:.2f}), {row['old_peak_mb']:.1f} -> "
+                  f"{row['new_peak_mb']:.1f} MB (x{row['memory_ratio']:.2f})"
+                  + ("  REGRESSION" if row["regression"] else ""))
+        raise SystemExit(1 if any(row["regression"] for row in rows) else 0)
+    if args.benchmark == "segmentation":
+        result = benchmark_segmentation(args.text_path, args.batch_size)
+    elif args.benchmark == "ids":
+        result = benchmark_ids(args.n, args.sample)
+    elif args.benchmark == "session":
+        result = benchmark_session(args.text_path, args.meta_path, args.mp,
+                                   args.parties)
+    for key, value in result.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,431 @@
+"""Builds ParlaMint-BA session files from the split `S_data` directory.
+
+Example:
+    python build.py /home/rupnik/parlamint/BiH/S_data /home/rupnik/parlamint/BiH/S \\
+        --mp /home/rupnik/parlamint/BiH/BiH_MPs_1998-2022_v1.xlsx \\
+        --parties /home/rupnik/parlamint/BiH/BiH_electoral_lists_1998-2022_v1.xlsx
+"""
+import argparse
+import json
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from dedup import UtteranceIndex, dedup_rates
+from instrumentation import record_session
+from manifest import BuildManifest, hash_code, hash_file, session_inputs
+from metadata import MetadataStore
+from packed import CODECS, pack_session, packed_path
+from speakers import ADDITIONAL_PERSONS_PATH, IGNORE_KEYS_PATH, SpeakerRegistry
+from utils import (SPLITTERS, SessionStats, build_session, get_pipeline,
+                   session_stats_path)
+
+# Segmentation cache in the output directory, used unless turned off:
+CACHE_NAME = ".segmentation_cache.sqlite"
+
+# Loaded once per worker by `init_worker`:
+_worker_state: Dict = {}
+
+
+def find_sessions(datadir: Union[str, Path]) -> List[Tuple[int, str, str]]:
+    """Finds all (term, session, suffix) triples in the split data directory.
+
+    Args:
+        datadir (Union[str, Path]): directory with `text_*`/`meta_*` files
+
+    Returns:
+        List[Tuple[int, str, str]]: sorted list of sessions.
+    """
+    from parse import compile
+    p = compile("{prefix}_T{term:02}_S{session}. {suffix}.{ending}")
+    sessions = set()
+    for f in Path(datadir).glob("text_*"):
+        r = p.parse(f.name)
+        if r is None:
+            continue
+        sessions.add((int(r["term"]), r["session"], r["suffix"]))
+    return sorted(sessions)
+
+
+def session_paths(datadir: Union[str, Path], term: int, session: str,
+                  suffix: str) -> Tuple[Path, Path]:
+    datadir = Path(datadir)
+    return (datadir / f"text_T{term:02}_S{session}. {suffix}.txt",
+            datadir / f"meta_T{term:02}_S{session}. {suffix}.tsv")
+
+
+def _text_size(datadir: Union[str, Path], term: int, session: str, suffix: str) -> int:
+    """Size of a session's text file, 0 if it can't be read; the build reports it."""
+    try:
+        return session_paths(datadir, term, session, suffix)[0].stat().st_size
+    except OSError:
+        return 0
+
+
+def output_name(term: int, session: str, suffix: str) -> str:
+    """Name of the TEI file for a session, e.g. `ParlaMint-BA_T07S12n.xml`."""
+    session_appended = session + suffix.replace("sjednica", "").\
+        replace("hitna", "h").replace("nastavak2", "n2").replace("nastavak3", "n3").\
+        replace("nastavak", "n").replace("vanredna", "v").replace("konst", "k").\
+        replace("nastavat", "n").replace("nastavk", "n")
+    session_appended = "".join(session_appended.split())
+    return f"ParlaMint-BA_T{term:02}S{session_appended}.xml"
+
+
+def init_worker(mp_path: Union[str, Path], parties_path: Union[str, Path],
+                cache_path: Optional[Union[str, Path]] = None,
+                splitter: str = "classla",
+                index_path: Optional[Union[str, Path]] = None) -> None:
+    """Loads classla and the MP/party tables once per worker process."""
+    if splitter == "classla":
+        get_pipeline()
+    _worker_state["metadata"] = MetadataStore.from_files(mp_path, parties_path)
+    _worker_state["speakers"] = SpeakerRegistry.from_tables(
+        _worker_state["metadata"].mpdf)
+    if cache_path is not None:
+        from segmentation_cache import SegmentationCache, get_model_version
+        if splitter == "classla":
+            model_version = get_model_version()
+        else:
+            # The rules don't use the cache, and classla needn't be installed:
+            from rule_splitter import RULES_VERSION
+            model_version = RULES_VERSION
+        _worker_state["cache"] = SegmentationCache(cache_path, model_version=model_version)
+    if index_path is not None:
+        from dedup import UtteranceIndex
+        _worker_state["index"] = UtteranceIndex(index_path)
+
+
+def process_session(term: int, session: str, suffix: str,
+                    datadir: Union[str, Path], outdir: Union[str, Path],
+                    checkpoint_dir: Optional[Union[str, Path]] = None,
+                    splitter: str = "classla",
+                    pack: Optional[str] = None
+                    ) -> Tuple[Path, SessionStats]:
+    """Builds a single session in a worker set up by `init_worker`.
+
+    With `checkpoint_dir`, the prepared session is also saved there as
+    `<name>.parquet` for debugging. With `pack` (`gzip` or `zstd`), a
+    packed copy of the session file is written next to it, see `packed`.
+
+    Returns:
+        Tuple[Path, SessionStats]: path of the written TEI file and its counts.
+    """
+    text_path, meta_path = session_paths(datadir, term, session, suffix)
+    assert text_path.exists(), "No text!"
+    name = output_name(term, session, suffix)
+    out_file = Path(outdir) / name
+    checkpoint = None
+    if checkpoint_dir is not None:
+        checkpoint = Path(checkpoint_dir) / Path(name).with_suffix(".parquet")
+    stats = build_session(
+        text_path=text_path,
+        meta_path=meta_path,
+        out_file=out_file,
+        term_index=term,
+        session_index=session,
+        data_language_code="bs",
+        metadata=_worker_state["metadata"],
+        speakers=_worker_state["speakers"],
+        cache=_worker_state.get("cache"),
+        checkpoint=checkpoint,
+        splitter=splitter,
+        index=_worker_state.get("index"),
+    )
+    if pack is not None:
+        pack_session(out_file, codec=pack)
+    return out_file, stats
+
+
+def _new_result(term: int, session: str, suffix: str,
+                error: Optional[str] = None) -> Dict:
+    return {"term": term, "session": session, "suffix": suffix,
+            "out_file": None, "stats": None, "error": error, "metrics": None}
+
+
+def _run_session(term: int, session: str, suffix: str,
+                 datadir: Union[str, Path], outdir: Union[str, Path],
+                 checkpoint_dir: Optional[Union[str, Path]] = None,
+                 splitter: str = "classla", metrics: bool = False,
+                 trace_memory: bool = False, pack: Optional[str] = None) -> Dict:
+    result = _new_result(term, session, suffix)
+    if not metrics:
+        _build_into(result, datadir, outdir, checkpoint_dir, splitter, pack)
+        return result
+    with record_session(output_name(term, session, suffix), trace_memory) as recorder:
+        _build_into(result, datadir, outdir, checkpoint_dir, splitter, pack)
+    result["metrics"] = recorder.to_record()
+    result["metrics"]["failed"] = result["error"] is not None
+    return result
+
+
+def _build_into(result: Dict, datadir: Union[str, Path], outdir: Union[str, Path],
+                checkpoint_dir: Optional[Union[str, Path]], splitter: str,
+                pack: Optional[str]) -> None:
+    try:
+        out_file, stats = process_session(
+            result["term"], result["session"], result["suffix"], datadir, outdir,
+            checkpoint_dir, splitter, pack)
+        result["out_file"] = str(out_file)
+        result["stats"] = stats.to_dict()
+    except Exception:
+        result["error"] = traceback.format_exc()
+
+
+def build_sessions(datadir: Union[str, Path], outdir: Union[str, Path],
+                   mp_path: Union[str, Path], parties_path: Union[str, Path],
+                   max_workers: int = 8,
+                   cache_path: Optional[Union[str, Path]] = None,
+                   sessions: Optional[List[Tuple[int, str, str]]] = None,
+                   manifest_path: Optional[Union[str, Path]] = None,
+                   checkpoint_dir: Optional[Union[str, Path]] = None,
+                   splitter: str = "classla",
+                   index_path: Optional[Union[str, Path]] = None,
+                   metrics_path: Optional[Union[str, Path]] = None,
+                   trace_memory: bool = False,
+                   pack: Optional[str] = None,
+                   use_cache: bool = True
+                   ) -> List[Dict]:
+    """Builds all sessions on a process pool.
+
+    Sessions are scheduled largest text file first, so the long sessions do
+    not end up running alone at the end. A failing session is recorded in
+    its result and does not stop the others; so is a worker that fails to
+    start (e.g. the classla model doesn't load) or dies, for the sessions it
+    takes down.
+
+    With a manifest, sessions whose inputs (text, metadata, MP/party tables
+    and code) are unchanged since the last build are skipped.
+
+    Args:
+        datadir (Union[str, Path]): directory with `text_*`/`meta_*` files
+        outdir (Union[str, Path]): output directory for the TEI files
+        mp_path (Union[str, Path]): path to MP metadata
+        parties_path (Union[str, Path]): path to Parties metadata
+        max_workers (int, optional): number of processes. Defaults to 8.
+        cache_path (Union[str, Path], optional): SQLite segmentation cache
+            shared by the workers, so sessions rebuilt with unchanged text
+            are not segmented again. Defaults to `CACHE_NAME` in `outdir`.
+        sessions (List[Tuple[int, str, str]], optional): sessions to build,
+            all in `datadir` if None.
+        manifest_path (Union[str, Path], optional): JSON build manifest for
+            incremental builds. Defaults to None.
+        checkpoint_dir (Union[str, Path], optional): if given, prepared
+            sessions are also saved there as Parquet, for debugging.
+            Defaults to None.
+        splitter (str, optional): sentence splitter, `classla` or the faster
+            `rules` (see `rule_splitter`). Defaults to `classla`.
+        index_path (Union[str, Path], optional): SQLite `UtteranceIndex`
+            the built sessions' utterances are recorded in, to find
+            utterances repeated across sessions. Defaults to None.
+        metrics_path (Union[str, Path], optional): JSON-lines file each
+            built session's stage times and counters are appended to, see
+            `instrumentation`. Defaults to None.
+        trace_memory (bool, optional): also record each stage's peak
+            memory with `tracemalloc`, which slows the build down. Only
+            used with `metrics_path`. Defaults to False.
+        pack (str, optional): also write each session packed with `gzip`
+            or `zstd`, with an index for random access to utterances (see
+            `packed`). The XML files are kept for the root TEI, validation
+            and annotation. Defaults to None.
+        use_cache (bool, optional): use the segmentation cache. Only the
+            `classla` splitter does. Defaults to True.
+
+    Returns:
+        List[Dict]: one result per session with `out_file` and `stats`, or
+            `error` set. `reasons` says why a session was (re)built or
+            skipped.
+    """
+    if sessions is None:
+        sessions = find_sessions(datadir)
+    sessions = sorted(sessions, key=lambda s: _text_size(datadir, *s), reverse=True)
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+    if checkpoint_dir is not None:
+        Path(checkpoint_dir).mkdir(parents=True, exist_ok=True)
+    if not use_cache or splitter != "classla":
+        cache_path = None
+    elif cache_path is None:
+        cache_path = Path(outdir) / CACHE_NAME
+    initargs = (mp_path, parties_path, cache_path, splitter, index_path)
+    # Parse and cache the workbooks once, before the workers read the cache:
+    MetadataStore.from_files(mp_path, parties_path)
+
+    results = []
+    reasons = {}
+    manifest = None
+    if manifest_path is not None:
+        manifest = BuildManifest(manifest_path)
+        shared = {"mp": hash_file(mp_path), "parties": hash_file(parties_path),
+                  "persons": hash_file(ADDITIONAL_PERSONS_PATH),
+                  "ignored speakers": hash_file(IGNORE_KEYS_PATH),
+                  "code": hash_code(), "splitter": splitter}
+        inputs = {}
+        to_build = []
+        for term, session, suffix in sessions:
+            name = output_name(term, session, suffix)
+            out_file = Path(outdir) / name
+            try:
+                inputs[name] = session_inputs(
+                    *session_paths(datadir, term, session, suffix), shared)
+            except OSError:
+                # Built anyway, so the error is reported for the session:
+                inputs[name] = None
+                reasons[name] = ["inputs unreadable"]
+            else:
+                reasons[name] = manifest.outdated(name, inputs[name], out_file)
+            if not reasons[name] and not session_stats_path(out_file).exists():
+                reasons[name] = ["stats missing"]
+            if (not reasons[name] and pack is not None
+                    and not packed_path(out_file, pack).exists()):
+                reasons[name] = ["packed file missing"]
+            if reasons[name]:
+                to_build.append((term, session, suffix))
+            else:
+                results.append({"term": term, "session": session,
+                                "suffix": suffix, "out_file": str(out_file),
+                                "stats": None, "error": None, "skipped": True,
+                                "reasons": ["inputs unchanged"]})
+        sessions = to_build
+
+    def collect(result: Dict) -> None:
+        name = output_name(result["term"], result["session"], result["suffix"])
+        result["skipped"] = False
+        result["reasons"] = reasons.get(name, [])
+        results.append(result)
+        if result["metrics"] is not None:
+            metrics_file.write(json.dumps(result["metrics"], ensure_ascii=False) + "\n")
+            metrics_file.flush()
+        if manifest is None:
+            return
+        if result["error"] is None and inputs[name] is not None:
+            manifest.record(name, inputs[name], result["out_file"])
+        else:
+            manifest.forget(name)
+
+    metrics = metrics_path is not None
+    metrics_file = open(metrics_path, "a", encoding="utf-8") if metrics else None
+    try:
+        if max_workers <= 1:
+            if sessions:
+                try:
+                    init_worker(*initargs)
+                except Exception:
+                    error = traceback.format_exc()
+                    for term, session, suffix in sessions:
+                        collect(_new_result(term, session, suffix, error))
+                    return results
+            for term, session, suffix in sessions:
+                collect(_run_session(term, session, suffix, datadir, outdir,
+                                     checkpoint_dir, splitter, metrics, trace_memory,
+                                     pack))
+            return results
+
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                 initargs=initargs) as executor:
+            futures = {
+                executor.submit(_run_session, term, session, suffix, datadir,
+                                outdir, checkpoint_dir, splitter, metrics, trace_memory,
+                                pack): (term, session, suffix)
+                for term, session, suffix in sessions
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception:
+                    # The worker failed to start or died, e.g. BrokenProcessPool:
+                    result = _new_result(*futures[future], traceback.format_exc())
+                collect(result)
+        return results
+    finally:
+        if manifest is not None:
+            manifest.save()
+        if metrics_file is not None:
+            metrics_file.close()
+
+
+def report_failures(results: List[Dict],
+                    index_path: Optional[Union[str, Path]] = None) -> None:
+    skipped = [r for r in results if r.get("skipped")]
+    failed = [r for r in results if r["error"] is not None]
+    built = [r for r in results if r["error"] is None and not r.get("skipped")]
+    print(f"Built {len(built)} of {len(results) - len(skipped)} sessions: "
+          f"{sum(r['stats']['speeches'] for r in built)} speeches, "
+          f"{sum(r['stats']['words'] for r in built)} words.")
+    if skipped:
+        print(f"Skipped {len(skipped)} sessions with unchanged inputs.")
+    dedup = Counter()
+    for r in built:
+        dedup.update(r["stats"].get("dedup", {}))
+    if dedup["utterances"]:
+        rates = dedup_rates(dedup)
+        print(f"Dropped {dedup['duplicate utterances']} of {dedup['utterances']} "
+              f"utterances as duplicates ({rates['duplicate_rate']:.1%}); "
+              f"segmented {dedup['segmented texts']} distinct texts "
+              f"({rates['segmentation_saved']:.1%} of segmentation saved).")
+    if index_path is not None:
+        with UtteranceIndex(index_path) as index:
+            summary = index.summary()
+        print(f"{summary['repeated_across_sessions']} of {summary['utterances']} "
+              f"indexed utterances ({summary['repeated_rate']:.1%}) also occur "
+              f"in other sessions.")
+    unresolved = Counter()
+    for r in built:
+        unresolved.update(r["stats"]["unresolved_speakers"])
+    if unresolved:
+        print(f"{len(unresolved)} unresolved speakers: "
+              + ", ".join(f"{name} ({n})" for name, n in unresolved.most_common()))
+    guessed = SessionStats()
+    for r in built:
+        guessed += SessionStats.from_dict(r["stats"])
+    if guessed.guessed_speakers:
+        print(f"{len(guessed.guessed_speakers)} speakers resolved by a guess, check them:")
+        for name, guess in sorted(guessed.guessed_speakers.items(),
+                                  key=lambda item: -item[1]["utterances"]):
+            print(f"  {name} -> {guess['id']} ({guess['match']}, "
+                  f"{guess['utterances']} utterances)")
+    for r in built:
+        if r.get("reasons"):
+            print(f"T{r['term']:02} S{r['session']} {r['suffix']} rebuilt: "
+                  f"{', '.join(r['reasons'])}")
+    for r in failed:
+        print(f"T{r['term']:02} S{r['session']} {r['suffix']} failed:\n{r['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("datadir")
+    parser.add_argument("outdir")
+    parser.add_argument("--mp", required=True)
+    parser.add_argument("--parties", required=True)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--cache", default=None,
+                        help=f"segmentation cache, defaults to {CACHE_NAME} in outdir")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="segment every session anew")
+    parser.add_argument("--manifest", default=None)
+    parser.add_argument("--checkpoints", default=None,
+                        help="directory to keep the prepared sessions in, for debugging")
+    parser.add_argument("--splitter", choices=SPLITTERS, default="classla",
+                        help="sentence splitter, `rules` is faster but less exact")
+    parser.add_argument("--index", default=None,
+                        help="SQLite index of utterances, to find repeats across sessions")
+    parser.add_argument("--metrics", default=None,
+                        help="append per-session stage times and counters to this JSON-lines "
+                             "file, summarize with `python instrumentation.py`")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="with --metrics, also record peak memory per stage (slower)")
+    parser.add_argument("--pack", choices=CODECS, default=None,
+                        help="also write compressed sessions indexed by xml:id, "
+                             "read them with `packed.PackedSession`")
+    args = parser.parse_args()
+
+    results = build_sessions(args.datadir, args.outdir, args.mp, args.parties,
+                             max_workers=args.workers, cache_path=args.cache,
+                             manifest_path=args.manifest,
+                             checkpoint_dir=args.checkpoints,
+                             splitter=args.splitter, index_path=args.index,
+                             metrics_path=args.metrics, trace_memory=args.trace_memory,
+                             pack=args.pack, use_cache=not args.no_cache)
+    report_failures(results, args.index)
@@ -0,0 +1,161 @@
+"""Deduplication of utterances, within sessions and across the corpus.
+
+Within a session, exact duplicates (same `ID` and text) are dropped and
+every distinct text is segmented once, before classla is called. Across
+sessions, an `UtteranceIndex` records the hashes of each session's
+utterances, so material repeated in continuation sessions can be flagged.
+
+Example:
+    python dedup.py /home/rupnik/parlamint/BiH/utterances.sqlite --session ParlaMint-BA_T07S12n.xml
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import pandas as pd
+
+
+def text_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def drop_duplicate_utterances(df: pd.DataFrame) -> Tuple[pd.DataFrame, Counter]:
+    """Adds a `text_hash` column and drops rows repeating an earlier `ID` and text.
+
+    Returns:
+        Tuple[pd.DataFrame, Counter]: deduplicated rows and counts of
+            `utterances` (before) and `duplicate utterances` (dropped).
+    """
+    df = df.assign(text_hash=df.Text.map(text_hash))
+    duplicated = df.duplicated(subset=["ID", "text_hash"])
+    counts = Counter({"utterances": len(df),
+                      "duplicate utterances": int(duplicated.sum())})
+    return df[~duplicated], counts
+
+
+def dedup_rates(counts: Dict[str, int]) -> Dict[str, float]:
+    """Shares of dropped rows and of texts that didn't need segmenting.
+
+    Args:
+        counts (Dict[str, int]): `utterances`, `duplicate utterances` and
+            `segmented texts`, e.g. `SessionStats.dedup`.
+    """
+    utterances = counts.get("utterances", 0)
+    kept = utterances - counts.get("duplicate utterances", 0)
+    return {
+        "duplicate_rate": counts.get("duplicate utterances", 0) / utterances
+        if utterances else 0.0,
+        "segmentation_saved": 1 - counts.get("segmented texts", 0) / kept
+        if kept else 0.0,
+    }
+
+
+class UtteranceIndex:
+    """Corpus-wide SQLite index of utterance hashes per session.
+
+    `add` replaces everything recorded for a session, so rebuilding a
+    session keeps the index current. Utterances shorter than `min_chars`
+    (`Hvala.`, `Izvolite.`) repeat everywhere and are not indexed.
+
+    Example:
+        index = UtteranceIndex("/home/rupnik/parlamint/BiH/utterances.sqlite")
+        index.add("ParlaMint-BA_T07S12n.xml", prepared)
+        index.repeated("ParlaMint-BA_T07S12n.xml")
+    """
+
+    def __init__(self, path: Union[str, Path], min_chars: int = 40) -> None:
+        self.path = str(path)
+        self.min_chars = min_chars
+        self._connection = sqlite3.connect(self.path, timeout=60)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS utterances (
+                hash TEXT NOT NULL,
+                session TEXT NOT NULL,
+                id TEXT NOT NULL
+            )""")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS utterances_hash ON utterances(hash)")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS utterances_session ON utterances(session)")
+        self._connection.commit()
+
+    def add(self, session: str, df: pd.DataFrame) -> int:
+        """Records a session's utterances (`ID`, `Text`, optionally `text_hash`).
+
+        Returns:
+            int: number of indexed utterances.
+        """
+        df = df[df.Text.str.len() >= self.min_chars]
+        hashes = df.text_hash if "text_hash" in df.columns else df.Text.map(text_hash)
+        rows = list(zip(hashes, [session] * len(df), df.ID.astype(str)))
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM utterances WHERE session = ?", (session,))
+            self._connection.executemany(
+                "INSERT INTO utterances VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def repeated(self, session: str) -> pd.DataFrame:
+        """Utterances of `session` that also occur in other sessions.
+
+        Returns:
+            pd.DataFrame: `id`, `hash` and the other `sessions`, comma separated.
+        """
+        rows = self._connection.execute(
+            """SELECT u.id, u.hash, GROUP_CONCAT(DISTINCT o.session)
+               FROM utterances u JOIN utterances o
+                 ON o.hash = u.hash AND o.session != u.session
+               WHERE u.session = ?
+               GROUP BY u.id, u.hash""", (session,)).fetchall()
+        return pd.DataFrame(rows, columns=["id", "hash", "sessions"])
+
+    def summary(self) -> Dict[str, Union[int, float]]:
+        """Corpus-wide counts of indexed and cross-session repeated utterances."""
+        sessions, utterances = self._connection.execute(
+            "SELECT COUNT(DISTINCT session), COUNT(*) FROM utterances").fetchone()
+        repeated = self._connection.execute(
+            """SELECT COUNT(*) FROM utterances u
+               WHERE EXISTS (SELECT 1 FROM utterances o
+                             WHERE o.hash = u.hash AND o.session != u.session)"""
+        ).fetchone()[0]
+        return {"sessions": sessions, "utterances": utterances,
+                "repeated_across_sessions": repeated,
+                "repeated_rate": repeated / utterances if utterances else 0.0}
+
+    def sessions_with_repeats(self) -> List[Tuple[str, int]]:
+        """Sessions and their number of utterances found in other sessions."""
+        return self._connection.execute(
+            """SELECT u.session, COUNT(*) FROM utterances u
+               WHERE EXISTS (SELECT 1 FROM utterances o
+                             WHERE o.hash = u.hash AND o.session != u.session)
+               GROUP BY u.session ORDER BY COUNT(*) DESC""").fetchall()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "UtteranceIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("index")
+    parser.add_argument("--session", default=None,
+                        help="list the repeated utterances of this session")
+    args = parser.parse_args()
+
+    with UtteranceIndex(args.index) as index:
+        if args.session is None:
+            print(json.dumps(index.summary(), indent=1))
+            for session, n in index.sessions_with_repeats():
+                print(f"{session}: {n}")
+        else:
+            print(index.repeated(args.session).to_string(index=False))
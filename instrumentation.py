@@ -0,0 +1,216 @@
+"""Opt-in timing and memory spans for session builds, and their summary.
+
+Nothing is recorded unless a session runs inside `record_session`; `span`,
+`Stages` and `count` are cheap no-ops otherwise. A recording gives one
+JSON-lines record per session with the time (and, with `trace_memory`, the
+peak traced memory) of every stage and the session's counters.
+
+Example:
+    python build.py ... --metrics build_metrics.jsonl
+    python instrumentation.py build_metrics.jsonl --top 10
+"""
+import argparse
+import json
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Union
+
+# Recorder of the session being built, if any:
+_current: Optional["Recorder"] = None
+
+
+class _Span:
+    def __init__(self, name: str, traced: int) -> None:
+        self.name = name
+        self.start = perf_counter()
+        self.traced = traced
+        self.peak = traced
+
+
+class Recorder:
+    """Collects stage times, memory peaks and counters of one session.
+
+    Stages of the same name add up. Memory is the peak `tracemalloc`
+    allocation above the stage's start, so it is only measured with
+    `trace_memory`, which slows down the build.
+    """
+
+    def __init__(self, session: str, trace_memory: bool = False) -> None:
+        self.session = session
+        self.trace_memory = trace_memory
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.peak_mb: Dict[str, float] = {}
+        self.counters: Counter = Counter()
+        self._open: List[_Span] = []
+        self._start = perf_counter()
+
+    def _traced(self) -> int:
+        import tracemalloc
+
+        current, peak = tracemalloc.get_traced_memory()
+        # The peak is reset for every span, so pass it on to the open ones:
+        for span in self._open:
+            span.peak = max(span.peak, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def open(self, name: str) -> _Span:
+        span = _Span(name, self._traced() if self.trace_memory else 0)
+        self._open.append(span)
+        return span
+
+    def close(self, span: _Span) -> None:
+        if self.trace_memory:
+            self._traced()
+            self.peak_mb[span.name] = max(self.peak_mb.get(span.name, 0.0),
+                                          (span.peak - span.traced) / 1024**2)
+        self._open.remove(span)
+        self.seconds[span.name] += perf_counter() - span.start
+
+    def to_record(self) -> Dict:
+        record = {"session": self.session,
+                  "s": perf_counter() - self._start,
+                  "stages": {name: {"s": s} for name, s in self.seconds.items()},
+                  "counters": dict(self.counters)}
+        for name, peak in self.peak_mb.items():
+            record["stages"][name]["peak_mb"] = peak
+        return record
+
+
+@contextmanager
+def record_session(session: str, trace_memory: bool = False) -> Iterator[Recorder]:
+    """Records the spans and counters of everything run inside."""
+    global _current
+    import tracemalloc
+
+    previous, _current = _current, Recorder(session, trace_memory)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        yield _current
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _current = previous
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Times the block as stage `name`."""
+    recorder = _current
+    if recorder is None:
+        yield
+        return
+    opened = recorder.open(name)
+    try:
+        yield
+    finally:
+        recorder.close(opened)
+
+
+class Stages:
+    """Times consecutive stages of a long function without nesting blocks.
+
+    Example:
+        stages = Stages("construct_TEI")
+        stages.start("read")
+        ...
+        stages.start("body")  # ends `read`
+        ...
+        stages.stop()
+    """
+
+    def __init__(self, prefix: str) -> None:
+        self.prefix = prefix
+        self.recorder = _current
+        self._span: Optional[_Span] = None
+
+    def start(self, name: str) -> None:
+        if self.recorder is None:
+            return
+        self.stop()
+        self._span = self.recorder.open(f"{self.prefix}.{name}")
+
+    def stop(self) -> None:
+        if self._span is not None:
+            self.recorder.close(self._span)
+            self._span = None
+
+
+def count(name: str, n: int = 1) -> None:
+    """Adds `n` to a counter of the session being recorded."""
+    if _current is not None:
+        _current.counters[name] += n
+
+
+def read_metrics(path: Union[str, Path]) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records: List[Dict], top: int = 10) -> Dict:
+    """Ranks the slowest sessions and the stages across a run.
+
+    Returns:
+        Dict: `sessions` (the `top` slowest, with their slowest stage) and
+            `stages` sorted by total time, with their share of the total,
+            mean, max and the session it was slowest in.
+    """
+    total = sum(r["s"] for r in records)
+    sessions = sorted(records, key=lambda r: r["s"], reverse=True)[:top]
+    stages: Dict[str, Dict] = {}
+    for r in records:
+        for name, stage in r["stages"].items():
+            summary = stages.setdefault(name, {"s": 0.0, "sessions": 0, "max_s": 0.0,
+                                               "slowest_session": None})
+            summary["s"] += stage["s"]
+            summary["sessions"] += 1
+            if stage["s"] > summary["max_s"]:
+                summary["max_s"], summary["slowest_session"] = stage["s"], r["session"]
+            if "peak_mb" in stage:
+                summary["max_peak_mb"] = max(summary.get("max_peak_mb", 0.0),
+                                             stage["peak_mb"])
+    for summary in stages.values():
+        summary["share"] = summary["s"] / total if total else 0.0
+        summary["mean_s"] = summary["s"] / summary["sessions"]
+    counters = Counter()
+    for r in records:
+        counters.update(r.get("counters", {}))
+    return {
+        "sessions_total": len(records),
+        "s": total,
+        "counters": dict(counters),
+        "sessions": [{"session": r["session"], "s": r["s"],
+                      "slowest_stage": max(r["stages"], key=lambda n: r["stages"][n]["s"],
+                                           default=None),
+                      "counters": r.get("counters", {})} for r in sessions],
+        "stages": dict(sorted(stages.items(), key=lambda item: item[1]["s"],
+                              reverse=True)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("metrics", help="JSON-lines file written by `build.py --metrics`")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    summary = summarize(read_metrics(args.metrics), args.top)
+    if args.json:
+        print(json.dumps(summary, indent=1, ensure_ascii=False))
+    else:
+        print(f"{summary['sessions_total']} sessions, {summary['s']:.1f} s in total.")
+        print("Stages:")
+        for name, stage in summary["stages"].items():
+            peak = f", peak {stage['max_peak_mb']:.1f} MB" if "max_peak_mb" in stage else ""
+            print(f"  {name}: {stage['s']:.1f} s ({stage['share']:.1%}), "
+                  f"mean {stage['mean_s']:.2f} s, max {stage['max_s']:.2f} s "
+                  f"in {stage['slowest_session']}{peak}")
+        print(f"Slowest {len(summary['sessions'])} sessions:")
+        for session in summary["sessions"]:
+            print(f"  {session['session']}: {session['s']:.1f} s, "
+                  f"mostly {session['slowest_stage']}")
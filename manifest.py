@@ -0,0 +1,98 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+# Code that determines the content of a session file, including the header
+# template in `construct_TEI`:
+CODE_FILES = [Path(__file__).with_name("utils.py"),
+              Path(__file__).with_name("speakers.py"),
+              Path(__file__).with_name("metadata.py"),
+              Path(__file__).with_name("rule_splitter.py"),
+              Path(__file__).with_name("dedup.py")]
+
+
+def hash_file(path: Union[str, Path], block_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(str(path), "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_code() -> str:
+    h = hashlib.sha256()
+    for path in CODE_FILES:
+        h.update(hash_file(path).encode())
+    return h.hexdigest()
+
+
+class BuildManifest:
+    """Records the inputs each session file was built from.
+
+    Every entry stores hashes of the session's text and metadata, the
+    MP/party tables and the code, together with the output path. A session
+    only needs rebuilding if one of these changed or its output is gone.
+
+    Example:
+        manifest = BuildManifest("/home/rupnik/parlamint/BiH/S/manifest.json")
+        reasons = manifest.outdated(name, inputs, out_file)
+        if not reasons:
+            ...  # up to date, skip
+        manifest.record(name, inputs, out_file)
+        manifest.save()
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.sessions: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.sessions = json.load(f)["sessions"]
+
+    def outdated(self, name: str, inputs: Dict[str, str],
+                 out_file: Union[str, Path]) -> List[str]:
+        """Lists the reasons a session must be rebuilt, empty if up to date.
+
+        Args:
+            name (str): session key, e.g. the output file name
+            inputs (Dict[str, str]): input name -> content hash
+            out_file (Union[str, Path]): where the output should be
+
+        Returns:
+            List[str]: human-readable reasons.
+        """
+        entry = self.sessions.get(name)
+        if entry is None:
+            return ["not built before"]
+        reasons = [f"{key} changed" for key in sorted(inputs)
+                   if entry["inputs"].get(key) != inputs[key]]
+        if entry["out_file"] != str(out_file):
+            reasons.append("output path changed")
+        elif not Path(out_file).exists():
+            reasons.append("output missing")
+        return reasons
+
+    def record(self, name: str, inputs: Dict[str, str],
+               out_file: Union[str, Path]) -> None:
+        self.sessions[name] = {"inputs": dict(inputs), "out_file": str(out_file)}
+
+    def forget(self, name: str) -> None:
+        self.sessions.pop(name, None)
+
+    def save(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"sessions": self.sessions}, f, indent=1, sort_keys=True)
+        tmp.replace(self.path)
+
+
+def session_inputs(text_path: Union[str, Path], meta_path: Union[str, Path],
+                   shared: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Hashes a session's own inputs and adds the shared ones."""
+    inputs = {"text": hash_file(text_path), "meta": hash_file(meta_path)}
+    inputs.update(shared or {})
+    return inputs
@@ -0,0 +1,214 @@
+import json
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from manifest import hash_file
+
+# Party names in the MP table that stand for an abbreviation in the electoral
+# lists (see 004):
+MP_PARTY_FIXES = {
+    # Full names instead of abbreviations:
+    "Socijaldemokrati BiH": "SD BiH",
+    "Koalicija za cjelovitu i demokratsku BiH (SDA BiH, SBiH, Liberali BiH, GDS)": "KCD BiH",
+    "NS Radom za boljitak": "NS RB",
+    "Koalicija ": "Koalicija",
+    "Demokratska fronta - Željko Komšić": "DF",
+    "DF – GS, Željko Komšić: BiH pobjeđuje!": "DF",
+    "NHI - HKDU": "NHI-HKDU",
+    "SBB - Fahrudin Radončić": "SBB",
+    "BPS - Sefer Halilović": "BPS",
+    # Only mentioned as part of Koalicija:
+    "HSP": "Koalicija",
+    "HDZ 1990 – HSPBiH": "Koalicija",
+    "Koalicija HDZ BiH, HSS, HKDU BiH, HSP DR. Ante Starčević, HSP Herceg-Bosne": "Koalicija",
+    # Based on the coalition composition, the terms and Željko Mirjanić's Wikipedia page:
+    "Koalicija SNSD - DSP": "K-SNSD",
+    # https://en.wikipedia.org/wiki/Economic_Bloc
+    "Ekonomski blok - HDU - Za boljitak": "EB",
+    "HDZ BiH - Hrvatska koalicija - HNZ": "HDZ-HK-HNZ",
+    # Independents:
+    "Samostalni poslanik": np.nan,
+    "none": np.nan,
+}
+
+# Files whose changes invalidate the cached tables:
+CODE_FILES = [Path(__file__)]
+
+
+def nicefy_abbreviations(s: str):
+    if isinstance(s, str):
+        return s.replace(" ", "_")
+    return s
+
+
+def clean_mp_table(mpdf: pd.DataFrame) -> pd.DataFrame:
+    """Applies the 004 party cleanup to the raw MP table."""
+    mpdf = mpdf.copy()
+    mpdf["party"] = mpdf.party.str.strip()
+    mpdf["party"] = mpdf.party.replace(MP_PARTY_FIXES)
+    # Only one of the two HSS MPs can be put in Koalicija; Šimić, Ilija keeps
+    # HSS, which is added to the root TEI by hand:
+    c = (mpdf.party == "HSS") & (mpdf.term2 == 7)
+    mpdf.loc[c, "party"] = "Koalicija"
+    mpdf["party"] = mpdf.party.apply(nicefy_abbreviations)
+    return mpdf
+
+
+def clean_parties_table(partiesdf: pd.DataFrame) -> pd.DataFrame:
+    partiesdf = partiesdf.copy()
+    partiesdf["party"] = partiesdf.party.str.strip().apply(nicefy_abbreviations)
+    partiesdf["full_name"] = partiesdf.full_name.str.strip()
+    return partiesdf
+
+
+def codemp_key(values: pd.Series) -> pd.Series:
+    """Normalizes MP codes for joining, so that `123`, `123.0` and `"123"` match."""
+    numbers = pd.to_numeric(values, errors="coerce")
+    keys = values.astype(str).str.strip()
+    integral = numbers.notna() & (numbers == numbers.round())
+    keys[integral] = numbers[integral].astype("int64").astype(str)
+    return keys.where(values.notna())
+
+
+def _stringify_mixed(df: pd.DataFrame) -> pd.DataFrame:
+    """Turns mixed-type columns (e.g. `-` among dates) into strings for Parquet."""
+    df = df.copy()
+    for c in df.columns:
+        if df[c].dtype == object and pd.api.types.infer_dtype(df[c], skipna=True) != "string":
+            df[c] = df[c].where(df[c].isna(), df[c].astype(str))
+    return df
+
+
+def _source_state(path: Path) -> Dict:
+    stat = path.stat()
+    return {"path": str(path), "mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+
+class MetadataStore:
+    """Cleaned MP and party tables, indexed for joining with the metadata.
+
+    MPs are indexed by `(term2, codemp)` and parties by `(term2, party)`, so
+    joining a session's utterances is a hash lookup per row. MPs without a
+    code can't be looked up; for duplicate keys the first row is used.
+
+    `from_files` parses and cleans the workbooks once and caches the clean
+    tables as Parquet. The cache is reused while the workbooks' mtime and
+    size, or failing that their hash, are unchanged.
+
+    Example:
+        store = MetadataStore.from_files(
+            "/home/rupnik/parlamint/BiH/BiH_MPs_1998-2022_v1.xlsx",
+            "/home/rupnik/parlamint/BiH/BiH_electoral_lists_1998-2022_v1.xlsx")
+        merged = store.join(metatextdf)
+    """
+
+    def __init__(self, mpdf: pd.DataFrame, partiesdf: pd.DataFrame) -> None:
+        self.mpdf = mpdf
+        self.partiesdf = partiesdf
+        mps = mpdf.assign(term2=mpdf.term2.astype("int64"),
+                          codemp=codemp_key(mpdf.codemp))
+        mps = mps[mps.codemp.notna()]
+        self.mps = mps.drop_duplicates(["term2", "codemp"]).\
+            set_index(["term2", "codemp"])
+        parties = partiesdf.assign(term2=partiesdf.term2.astype("int64"))
+        parties = parties[parties.party.notna()]
+        self.parties = parties.drop_duplicates(["term2", "party"]).\
+            set_index(["term2", "party"])
+
+    @classmethod
+    def from_tables(cls, mpdf: pd.DataFrame, partiesdf: pd.DataFrame) -> "MetadataStore":
+        """Builds the store from the raw (uncleaned) tables."""
+        return cls(clean_mp_table(mpdf), clean_parties_table(partiesdf))
+
+    @classmethod
+    def from_files(cls, mp_path: Union[str, Path], parties_path: Union[str, Path],
+                   cache_dir: Optional[Union[str, Path]] = None) -> "MetadataStore":
+        """Loads the store from the workbooks, through the Parquet cache.
+
+        Args:
+            mp_path (Union[str, Path]): MP workbook
+            parties_path (Union[str, Path]): electoral lists workbook
+            cache_dir (Union[str, Path], optional): where to cache the clean
+                tables. Defaults to `.metadata_cache` next to `mp_path`.
+        """
+        mp_path, parties_path = Path(mp_path), Path(parties_path)
+        cache_dir = Path(cache_dir) if cache_dir is not None \
+            else mp_path.parent / ".metadata_cache"
+        sources = {"mp": _source_state(mp_path),
+                   "parties": _source_state(parties_path)}
+        state_file = cache_dir / "sources.json"
+        mp_file, parties_file = cache_dir / "mps.parquet", cache_dir / "parties.parquet"
+
+        cached = None
+        if state_file.exists() and mp_file.exists() and parties_file.exists():
+            with open(state_file) as f:
+                cached = json.load(f)
+        code = "".join(hash_file(path) for path in CODE_FILES)
+        if cached is not None and cached["code"] == code and \
+                cls._sources_unchanged(cached["sources"], sources):
+            return cls(pd.read_parquet(mp_file), pd.read_parquet(parties_file))
+
+        store = cls.from_tables(pd.read_excel(str(mp_path)),
+                                pd.read_excel(str(parties_path)))
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for df, path in ((store.mpdf, mp_file), (store.partiesdf, parties_file)):
+            tmp = path.with_name(path.name + ".tmp")
+            _stringify_mixed(df).to_parquet(tmp, index=False)
+            tmp.replace(path)
+        for source in sources.values():
+            source["sha256"] = hash_file(source["path"])
+        tmp = state_file.with_name(state_file.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"sources": sources, "code": code}, f, indent=1)
+        tmp.replace(state_file)
+        return cls(pd.read_parquet(mp_file), pd.read_parquet(parties_file))
+
+    @staticmethod
+    def _sources_unchanged(cached: Dict, current: Dict) -> bool:
+        for name, source in current.items():
+            old = cached.get(name)
+            if old is None or old["path"] != source["path"]:
+                return False
+            if (old["mtime"], old["size"]) == (source["mtime"], source["size"]):
+                continue
+            # Touched, but possibly not changed:
+            if old["sha256"] != hash_file(source["path"]):
+                return False
+        return True
+
+    def mp(self, term: int, codemp) -> Optional[pd.Series]:
+        key = codemp_key(pd.Series([codemp]))[0]
+        try:
+            return self.mps.loc[(int(term), key)]
+        except KeyError:
+            return None
+
+    def party(self, term: int, party: str) -> Optional[pd.Series]:
+        try:
+            return self.parties.loc[(int(term), party)]
+        except KeyError:
+            return None
+
+    def join(self, df: pd.DataFrame, term_column: str = "term2",
+             codemp_column: str = "Codemp") -> pd.DataFrame:
+        """Left-joins MP and then party columns onto the session metadata.
+
+        Columns that already exist in `df` get an `_mp` or `_party` suffix.
+        """
+        keys = pd.MultiIndex.from_arrays(
+            [df[term_column].astype("int64"), codemp_key(df[codemp_column])])
+        mps = self.mps.reindex(keys)
+        mps.index = df.index
+        party = mps.party.to_numpy()
+        mps.columns = [c + "_mp" if c in df.columns else c for c in mps.columns]
+        df = pd.concat([df, mps], axis=1)
+
+        keys = pd.MultiIndex.from_arrays([df[term_column].astype("int64"), party])
+        parties = self.parties.reindex(keys)
+        parties.index = df.index
+        parties.columns = [c + "_party" if c in df.columns else c
+                           for c in parties.columns]
+        return pd.concat([df, parties], axis=1)
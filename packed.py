@@ -0,0 +1,306 @@
+"""Compressed session files with random access to utterances and sentences.
+
+A packed session is the session file compressed as a series of independent
+gzip members or zstd frames: one for the header, one per group of whole
+utterances (up to `frame_bytes` uncompressed) and one for the rest. The
+members concatenate to the original file, so `gzip -dc`/`zstd -dc` (or
+`unpack_session`) give back the ParlaMint file byte for byte.
+
+A sidecar index (`<packed file>.idx.json`) maps every `u` and `seg`
+`xml:id` to its frame and position, so `PackedSession.get` fetches a single
+utterance by decompressing only its frame.
+
+Example:
+    python packed.py pack /home/rupnik/parlamint/BiH/S /home/rupnik/parlamint/BiH/S.packed --codec zstd
+    python packed.py get /home/rupnik/parlamint/BiH/S.packed/ParlaMint-BA_T07S12n.xml.zst ParlaMint-BA_T07S12n.u5
+    python packed.py unpack /home/rupnik/parlamint/BiH/S.packed /home/rupnik/parlamint/BiH/S
+"""
+import argparse
+import json
+import re
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+CODECS = ("gzip", "zstd")
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 10}
+
+_XML_ID = re.compile(rb'xml:id="([^"]+)"')
+
+
+def _check_codec(codec: str) -> None:
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}, use one of {', '.join(CODECS)}.")
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The zstd codec needs the `zstandard` package: "
+                          "pip install zstandard") from None
+    return zstandard
+
+
+def _compressor(codec: str, level: Optional[int] = None) -> Callable[[bytes], bytes]:
+    """Returns a function compressing data into one self-contained member/frame."""
+    _check_codec(codec)
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == "gzip":
+        import gzip
+        return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    return _zstandard().ZstdCompressor(level=level).compress
+
+
+def _decompressor(codec: str) -> Callable[[bytes], bytes]:
+    _check_codec(codec)
+    if codec == "gzip":
+        import gzip
+        return gzip.decompress
+    return _zstandard().ZstdDecompressor().decompress
+
+
+def packed_path(session_file: Union[str, Path], codec: str = "gzip") -> Path:
+    """`ParlaMint-BA_T07S12n.xml` -> `ParlaMint-BA_T07S12n.xml.gz`"""
+    _check_codec(codec)
+    session_file = Path(session_file)
+    return session_file.with_name(session_file.name + SUFFIXES[codec])
+
+
+def index_path(packed_file: Union[str, Path]) -> Path:
+    """Sidecar index of a packed session, e.g. `ParlaMint-BA_T07S12n.xml.gz.idx.json`."""
+    packed_file = Path(packed_file)
+    return packed_file.with_name(packed_file.name + ".idx.json")
+
+
+def _frames(lines: Iterator[bytes], frame_bytes: int
+            ) -> Iterator[Tuple[bytes, List[Tuple[str, int, int, str]]]]:
+    """Groups the lines of a session file into frames of whole utterances.
+
+    Yields:
+        Tuple[bytes, List[Tuple[str, int, int, str]]]: uncompressed frame
+            and the (`xml:id`, start, end, tag) of the `u`s and `seg`s in it.
+    """
+    frame, size, ids = [], 0, []
+    u_start = seg_start = None
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith(b"<u ") and u_start is None:
+            if size >= frame_bytes or (size and not ids):
+                # Full, or the header before the first utterance:
+                yield b"".join(frame), ids
+                frame, size, ids = [], 0, []
+            u_start = size, _XML_ID.search(line).group(1).decode()
+        if stripped.startswith(b"<seg ") and u_start is not None:
+            seg_start = size, _XML_ID.search(line).group(1).decode()
+        frame.append(line)
+        size += len(line)
+        if seg_start is not None and stripped.endswith(b"</seg>"):
+            ids.append((seg_start[1], seg_start[0], size, "seg"))
+            seg_start = None
+        elif stripped == b"</u>" and u_start is not None:
+            ids.append((u_start[1], u_start[0], size, "u"))
+            u_start = None
+    if ids and size:
+        # The trailer after the last utterance gets a frame of its own:
+        last_end = max(end for _, _, end, _ in ids)
+        data = b"".join(frame)
+        yield data[:last_end], ids
+        frame, ids, size = [data[last_end:]], [], len(data) - last_end
+    if size:
+        yield b"".join(frame), ids
+
+
+def pack_session(session_file: Union[str, Path],
+                 out_file: Optional[Union[str, Path]] = None,
+                 codec: str = "gzip", level: Optional[int] = None,
+                 frame_bytes: int = 64 * 1024) -> Path:
+    """Compresses a session file into independent frames and indexes its IDs.
+
+    The file is read line by line, so memory is bounded by `frame_bytes`
+    and the longest utterance. Works for plain and `.ana` session files.
+
+    Args:
+        session_file (Union[str, Path]): pretty-printed session file
+        out_file (Union[str, Path], optional): packed file. Defaults to
+            `session_file` with the codec's suffix added.
+        codec (str, optional): `gzip` or `zstd` (needs `zstandard`).
+            Defaults to `gzip`.
+        level (int, optional): compression level. Defaults to the codec's
+            `DEFAULT_LEVELS`.
+        frame_bytes (int, optional): uncompressed size after which a frame
+            is closed; an utterance is never split. Smaller frames mean
+            faster lookups and worse compression. Defaults to 64 KiB.
+
+    Returns:
+        Path: the packed file; the index is next to it, see `index_path`.
+    """
+    compress = _compressor(codec, level)
+    out_file = packed_path(session_file, codec) if out_file is None else Path(out_file)
+    tmp = out_file.with_name(out_file.name + ".tmp")
+    frames, ids, utterances, offset, size = [], {}, [], 0, 0
+    with open(session_file, "rb") as f, open(tmp, "wb") as out:
+        for data, frame_ids in _frames(f, frame_bytes):
+            compressed = compress(data)
+            out.write(compressed)
+            for xml_id, start, end, tag in frame_ids:
+                ids[xml_id] = [len(frames), start, end]
+                if tag == "u":
+                    utterances.append(xml_id)
+            frames.append([offset, len(compressed), len(data)])
+            offset += len(compressed)
+            size += len(data)
+    index = {"codec": codec, "source": Path(session_file).name, "size": size,
+             "frames": frames, "ids": ids, "utterances": utterances}
+    tmp_index = tmp.with_name(tmp.name + ".idx.json")
+    with open(tmp_index, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    tmp.replace(out_file)
+    tmp_index.replace(index_path(out_file))
+    return out_file
+
+
+class PackedSession:
+    """Random access to the utterances of a packed session.
+
+    The last decompressed frame is kept, so reading the utterances of a
+    session in order decompresses every frame once.
+
+    Example:
+        with PackedSession("ParlaMint-BA_T07S12n.xml.gz") as session:
+            u = session.element("ParlaMint-BA_T07S12n.u5")
+            session.get("ParlaMint-BA_T07S12n.u5.s0")
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        with open(index_path(self.path)) as f:
+            index = json.load(f)
+        self.codec = index["codec"]
+        self.source = index["source"]
+        self.frames: List[List[int]] = index["frames"]
+        self.ids: Dict[str, List[int]] = index["ids"]
+        self.utterances: List[str] = index["utterances"]
+        self._decompress = _decompressor(self.codec)
+        self._file = open(self.path, "rb")
+        self._cached: Tuple[Optional[int], bytes] = (None, b"")
+
+    def __contains__(self, xml_id: str) -> bool:
+        return xml_id in self.ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _frame(self, i: int) -> bytes:
+        if self._cached[0] != i:
+            offset, length, _ = self.frames[i]
+            self._file.seek(offset)
+            self._cached = i, self._decompress(self._file.read(length))
+        return self._cached[1]
+
+    def get(self, xml_id: str) -> str:
+        """The `u` or `seg` with `xml_id` as XML, as in the session file.
+
+        Raises:
+            KeyError: if there is no such `u` or `seg`.
+        """
+        frame, start, end = self.ids[xml_id]
+        return self._frame(frame)[start:end].decode("utf-8").strip()
+
+    def element(self, xml_id: str):
+        """The `u` or `seg` with `xml_id`, parsed with ElementTree."""
+        from xml.etree.ElementTree import XML
+        return XML(self.get(xml_id))
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        """The session file, frame by frame."""
+        for i in range(len(self.frames)):
+            yield self._frame(i)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "PackedSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def unpack_session(packed_file: Union[str, Path],
+                   out_file: Optional[Union[str, Path]] = None) -> Path:
+    """Writes the ParlaMint session file a packed session was made from.
+
+    Args:
+        packed_file (Union[str, Path]): packed session
+        out_file (Union[str, Path], optional): defaults to the original file
+            name next to `packed_file`.
+
+    Returns:
+        Path: the written session file.
+    """
+    with PackedSession(packed_file) as session:
+        if out_file is None:
+            out_file = session.path.with_name(session.source)
+        out_file = Path(out_file)
+        tmp = out_file.with_name(out_file.name + ".tmp")
+        with open(tmp, "wb") as f:
+            for data in session.iter_bytes():
+                f.write(data)
+    tmp.replace(out_file)
+    return out_file
+
+
+def pack_corpus(session_dir: Union[str, Path], outdir: Union[str, Path],
+                codec: str = "gzip", level: Optional[int] = None,
+                frame_bytes: int = 64 * 1024,
+                pattern: str = "ParlaMint-BA_T*.xml") -> List[Path]:
+    """Packs all session files of a directory into `outdir`."""
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    return [pack_session(f, packed_path(outdir / f.name, codec), codec, level, frame_bytes)
+            for f in sorted(Path(session_dir).glob(pattern))]
+
+
+def unpack_corpus(packed_dir: Union[str, Path], outdir: Union[str, Path]) -> List[Path]:
+    """Regenerates the session files of all packed sessions in `packed_dir`."""
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for index in sorted(Path(packed_dir).glob("*.idx.json")):
+        packed_file = index.with_name(index.name[:-len(".idx.json")])
+        with open(index) as f:
+            source = json.load(f)["source"]
+        written.append(unpack_session(packed_file, outdir / source))
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="pack the session files of a directory")
+    pack.add_argument("session_dir")
+    pack.add_argument("outdir")
+    pack.add_argument("--codec", choices=CODECS, default="gzip")
+    pack.add_argument("--level", type=int, default=None)
+    pack.add_argument("--frame-kib", type=int, default=64,
+                      help="uncompressed KiB per frame, lookups decompress one frame")
+    unpack = commands.add_parser("unpack", help="regenerate the session files")
+    unpack.add_argument("packed_dir")
+    unpack.add_argument("outdir")
+    get = commands.add_parser("get", help="print utterances or sentences by xml:id")
+    get.add_argument("packed_file")
+    get.add_argument("ids", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        packed = pack_corpus(args.session_dir, args.outdir, args.codec, args.level,
+                             args.frame_kib * 1024)
+        print(f"Packed {len(packed)} sessions into {args.outdir}.")
+    elif args.command == "unpack":
+        written = unpack_corpus(args.packed_dir, args.outdir)
+        print(f"Wrote {len(written)} sessions to {args.outdir}.")
+    else:
+        with PackedSession(args.packed_file) as session:
+            for xml_id in args.ids:
+                print(session.get(xml_id))
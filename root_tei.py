@@ -0,0 +1,371 @@
+"""Builds the ParlaMint-BA root TEI file from the MP and party tables.
+
+Example:
+    python root_tei.py /home/rupnik/parlamint/BiH/ParlaMint-BA_template.xml \\
+        /home/rupnik/parlamint/BiH/ParlaMint-BA.xml \\
+        --mp /home/rupnik/parlamint/BiH/mpdf_corrected.pickle \\
+        --parties /home/rupnik/parlamint/BiH/partiesdf_corrected.pickle \\
+        --sessions /home/rupnik/parlamint/BiH/S/
+"""
+import argparse
+import pickle
+from pathlib import Path
+from string import Template
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from xml.etree.ElementTree import Element, SubElement
+
+import numpy as np
+import pandas as pd
+
+from speakers import ADDITIONAL_PERSONS_PATH, reference_name
+from utils import (SessionStats, pretty_element, read_session_stats,
+                   session_stats_path)
+
+# Typos in the source dates:
+DATE_FIXES = {"3013-12-30": "2013-12-30"}
+
+# Parties missing from the electoral lists, added by hand:
+EXTRA_PARTIES = [
+    ("party.NEZAVISNI", "nezavisni", "NEZAVISNI"),
+    ("party.HSS", "Hrvatska seljačka stranka", "HSS"),
+    ("party.GDS", "Građanska demokratska stranka", "GDS"),
+    ("party.BSP", "Bosanskohercegovačka stranka prava 1861", "BSP"),
+]
+
+
+def prepare_mp_table(mpdf: pd.DataFrame) -> pd.DataFrame:
+    """Adds person IDs and fills in missing values in the corrected MP table.
+
+    MPs without a codemp get `i999`, 999 being their row number, and missing
+    birth dates are replaced by the birth year where known.
+    """
+    mpdf = mpdf.copy()
+    mpdf["party"] = mpdf.party.fillna("NEZAVISNI")
+    mpdf["reference_name"] = mpdf.fullname.apply(reference_name)
+
+    c = mpdf.codemp.isna()
+    new_code_mps = np.array([f"i{i:03d}" for i, j in enumerate(c)])
+    mpdf.loc[c, "codemp"] = new_code_mps[c]
+
+    c = (mpdf.date_of_birth == "-") & (~mpdf.year_of_birth.isna()) & (~(mpdf.year_of_birth == "-"))
+    # As text, `date_of_birth` may be a string column that refuses numbers:
+    mpdf.loc[c, "date_of_birth"] = mpdf.year_of_birth[c].astype(str)
+    return mpdf
+
+
+def prepare_parties_table(partiesdf: pd.DataFrame) -> pd.DataFrame:
+    partiesdf = partiesdf.copy()
+    partiesdf["full_name"] = partiesdf.full_name.replace({
+        "Demokratska narodna zajednica": "Demokratska narodna zajednica BiH",
+    })
+    partiesdf["id"] = partiesdf.party.copy()
+    return partiesdf
+
+
+def read_terms(path: Union[str, Path]) -> Dict[int, Tuple[str, str]]:
+    """Reads `terms.csv` (see 003) into term -> (from, to)."""
+    termdata = pd.read_csv(str(path)).set_index("Term")
+    return {int(term): (str(row["From"]), None if pd.isna(row["To"]) else str(row["To"]))
+            for term, row in termdata.iterrows()}
+
+
+def _set_period(element: Element, period: Tuple[str, str]) -> None:
+    element.set("from", period[0])
+    if period[1] is not None:
+        element.set("to", period[1])
+
+
+def iter_list_event(terms: Dict[int, Tuple[str, str]]) -> Iterator[str]:
+    listEvent = Element("listEvent")
+    head = SubElement(listEvent, "head")
+    head.set("xml:lang", "bs")
+    head.text = "Mandatno obdoblje"
+    head = SubElement(listEvent, "head")
+    head.set("xml:lang", "en")
+    head.text = "Legislative period"
+
+    for term, period in terms.items():
+        event = SubElement(listEvent, "event")
+        event.set("xml:id", f"PS.{term}")
+        _set_period(event, period)
+        label = SubElement(event, "label")
+        label.set("xml:lang", "bs")
+        label.text = f"{term}. saziv"
+        label = SubElement(event, "label")
+        label.set("xml:lang", "en")
+        label.text = f"Term {term}"
+    yield pretty_element(listEvent)
+
+
+def _org(org_id: str, full_name: str, abbreviation: str) -> Element:
+    org = Element("org")
+    org.set("xml:id", org_id)
+    org.set("role", "parliamentaryGroup")
+    orgName = SubElement(org, "orgName")
+    orgName.set("full", "yes")
+    orgName.set("xml:lang", "bs")
+    orgName.text = full_name
+    orgName = SubElement(org, "orgName")
+    orgName.set("full", "abb")
+    orgName.text = abbreviation
+    return org
+
+
+def iter_orgs(partiesdf: pd.DataFrame) -> Iterator[str]:
+    partydata = partiesdf["party full_name id".split()].drop_duplicates()
+    for party, full_name, org_id in partydata.itertuples(index=False):
+        yield pretty_element(_org(org_id, full_name, party))
+    for org_id, full_name, abbreviation in EXTRA_PARTIES:
+        yield pretty_element(_org(org_id, full_name, abbreviation))
+
+
+def _birth_date(date_of_birth) -> str:
+    """Formats a YYYYMMDD date or a YYYY year as ISO, empty otherwise."""
+    birth = str(date_of_birth)
+    if not birth.isdigit():
+        return ""
+    if len(birth) == 8:
+        return f"{birth[0:4]}-{birth[4:6]}-{birth[6:]}"
+    if len(birth) == 4:
+        return birth
+    return ""
+
+
+def _affiliation(person: Element, ref: str, period: Tuple[str, str],
+                 role_name: str, ana: str = None) -> None:
+    aff = SubElement(person, "affiliation")
+    aff.set("role", "member")
+    aff.set("ref", ref)
+    if ana is not None:
+        aff.set("ana", ana)
+    _set_period(aff, period)
+    rolename = SubElement(aff, "roleName")
+    rolename.set("xml:lang", "en")
+    rolename.text = role_name
+
+
+def iter_persons(mpdf: pd.DataFrame, partiesdf: pd.DataFrame,
+                 terms: Dict[int, Tuple[str, str]],
+                 additional_persons: Iterable[Element] = ()) -> Iterator[str]:
+    """Yields `person` elements for the hand-added persons and all MPs.
+
+    The MP table is grouped once by `reference_name`; every row of a person
+    adds a party affiliation (for parties on the electoral lists) and an MP
+    affiliation for its term. Rows of terms missing from `terms` are
+    skipped.
+    """
+    for person in additional_persons:
+        yield pretty_element(person)
+
+    known_parties = set(partiesdf.party)
+    for name, subset in mpdf.groupby("reference_name", sort=False):
+        first = subset.iloc[0]
+        person = Element("person")
+        person.set("xml:id", name)
+        persName = SubElement(person, "persName")
+        buf = SubElement(persName, "surname")
+        buf.text = first.lastname
+        buf = SubElement(persName, "forename")
+        buf.text = first.firstname
+        buf = SubElement(person, "sex")
+        buf.set("value", "M" if first.gender == 0 else "F")
+        birth = _birth_date(first.date_of_birth)
+        if birth:
+            buf = SubElement(person, "birth")
+            buf.set("when", birth)
+
+        for row in subset.drop_duplicates().itertuples(index=False):
+            period = terms.get(int(row.term2))
+            if period is None:
+                continue
+            if row.party != "-" and row.party in known_parties:
+                _affiliation(person, f"#{row.party}", period, "Member")
+            _affiliation(person, "#PS", period, "MP", ana=f"#PS.{row.term2}")
+        yield pretty_element(person)
+
+
+def iter_xi_includes(session_dir: Union[str, Path]) -> Iterator[str]:
+    for file in sorted(Path(session_dir).glob("ParlaMint-BA_T*.xml")):
+        yield f"""    <xi:include xmlns:xi="http://www.w3.org/2001/XInclude" href="{file.name}"/>\n"""
+
+
+def iter_list_relation(partiesdf: pd.DataFrame, mpdf: pd.DataFrame,
+                       terms: Dict[int, Tuple[str, str]]) -> Iterator[str]:
+    partiesdf = partiesdf.assign(coalition=partiesdf.coalition.astype(str))
+    known_ids = set(partiesdf.id)
+    members = {
+        key: " ".join(sorted({"#" + i for i in ids if i in known_ids}))
+        for key, ids in partiesdf.groupby(["term2", "coalition"]).id
+    }
+    for term in partiesdf.term2.unique():
+        if term > mpdf.term2.max() or int(term) not in terms:
+            continue
+        period = terms[int(term)]
+        coalition = members.get((term, "1"), "")
+        opposition = members.get((term, "0"), "")
+        to = f'to="{period[1]}"' if period[1] is not None else ""
+        yield f"""
+    <relation name="coalition"
+            mutual="{coalition}"
+            from="{period[0]}"
+            {to}
+            ana="#PS.{term}"/>
+    <relation name="opposition"
+            active="{opposition}"
+            passive="#government.BA"
+            from="{period[0]}"
+            {to}
+            ana="#PS.{term}"/>\n"""
+
+
+def format_extent(speeches: int, words: int) -> str:
+    return f"""<measure unit="speeches" quantity="{speeches}" xml:lang="bs">{f'{speeches:,d}'.replace(',','.')} govora</measure>
+<measure unit="speeches" quantity="{speeches}" xml:lang="en">{speeches:,d} speeches</measure>
+<measure unit="words" quantity="{words}" xml:lang="bs">{f'{words:,d}'.replace(',','.')} riječi</measure>
+<measure unit="words" quantity="{words}" xml:lang="en">{words:,d} words</measure>
+"""
+
+
+def format_tagusage(tagusage: Dict[str, int]) -> str:
+    return "".join(f"""<tagUsage gi="{gi}" occurs="{int(occurs)}"/>\n"""
+                   for gi, occurs in tagusage.items())
+
+
+def merge_session_stats(session_dir: Union[str, Path]
+                        ) -> Tuple[SessionStats, Dict[int, Tuple[str, str]]]:
+    """Merges the stats sidecars written by `construct_TEI`.
+
+    Sidecars are small, so this replaces re-parsing every session file for
+    the root's extent and tagUsage, and concatenating all `*meta.tsv` files
+    for the term dates.
+
+    Args:
+        session_dir (Union[str, Path]): directory with the session files
+
+    Returns:
+        Tuple[SessionStats, Dict[int, Tuple[str, str]]]: corpus totals and
+            the (from, to) period of every term.
+    """
+    session_dir = Path(session_dir)
+    total = SessionStats()
+    terms: Dict[int, SessionStats] = {}
+    for file in sorted(session_dir.glob("ParlaMint-BA_T*.xml")):
+        path = session_stats_path(file)
+        if not path.exists():
+            raise FileNotFoundError(f"No stats for {file.name}, rebuild the session.")
+        term, stats = read_session_stats(path)
+        stats.date_from = DATE_FIXES.get(stats.date_from, stats.date_from)
+        stats.date_to = DATE_FIXES.get(stats.date_to, stats.date_to)
+        total += stats
+        period = terms.setdefault(term, SessionStats())
+        period.date_from = min(filter(None, [period.date_from, stats.date_from]))
+        period.date_to = max(filter(None, [period.date_to, stats.date_to]))
+    return total, {term: (terms[term].date_from, terms[term].date_to)
+                   for term in sorted(terms)}
+
+
+def write_terms(terms: Dict[int, Tuple[str, str]], path: Union[str, Path]) -> None:
+    """Writes term periods in the `terms.csv` format read by `read_terms`."""
+    pd.DataFrame(
+        [(term, date_from, date_to) for term, (date_from, date_to) in terms.items()],
+        columns=["Term", "From", "To"],
+    ).to_csv(str(path), index=False)
+
+
+def write_root_TEI(template_path: Union[str, Path], out_file: Union[str, Path],
+                   sections: Dict[str, Iterable[str]]) -> None:
+    """Fills a `string.Template` root template, streaming each section.
+
+    Behaves like `Template.substitute`, but section contents are written
+    chunk by chunk instead of being joined in memory first.
+
+    Args:
+        template_path (Union[str, Path]): template with `$listPerson` etc.
+        out_file (Union[str, Path]): output path
+        sections (Dict[str, Iterable[str]]): placeholder -> chunks
+    """
+    with open(template_path) as f:
+        content = f.read()
+    pattern = Template.pattern
+    with open(out_file, "w") as out:
+        position = 0
+        for match in pattern.finditer(content):
+            out.write(content[position:match.start()])
+            if match.group("escaped") is not None:
+                out.write(Template.delimiter)
+            elif match.group("invalid") is not None:
+                raise ValueError(f"Invalid placeholder in template at {match.start()}")
+            else:
+                name = match.group("named") or match.group("braced")
+                for chunk in sections[name]:
+                    out.write(chunk)
+            position = match.end()
+        out.write(content[position:])
+
+
+def build_root_TEI(mpdf: pd.DataFrame, partiesdf: pd.DataFrame,
+                   terms: Optional[Dict[int, Tuple[str, str]]],
+                   session_dir: Union[str, Path],
+                   template_path: Union[str, Path], out_file: Union[str, Path],
+                   additional_persons: List[Element] = None) -> List[int]:
+    """Writes the root TEI.
+
+    Extent, tagUsage and the corpus dates (`$dateFrom`, `$dateTo`, e.g. for
+    `settingDesc`) come from the session stats sidecars. MP table terms
+    without a period (with session terms: without built sessions) are left
+    out of the affiliations and relations, and reported.
+
+    Args:
+        mpdf (pd.DataFrame): corrected MP table (see 004)
+        partiesdf (pd.DataFrame): corrected party table (see 004)
+        terms (Dict[int, Tuple[str, str]], optional): term periods, see
+            `read_terms`. Taken from the session stats if None.
+        session_dir (Union[str, Path]): directory with the session files
+        template_path (Union[str, Path]): root template
+        out_file (Union[str, Path]): output path
+        additional_persons (List[Element], optional): hand-added persons,
+            read from `005_additional_persons.pickle` if None.
+
+    Returns:
+        List[int]: the skipped terms.
+    """
+    if additional_persons is None:
+        with open(ADDITIONAL_PERSONS_PATH, "rb") as f:
+            additional_persons = pickle.load(f)
+    mpdf = prepare_mp_table(mpdf)
+    partiesdf = prepare_parties_table(partiesdf)
+    total, session_terms = merge_session_stats(session_dir)
+    if terms is None:
+        terms = session_terms
+    skipped = sorted({int(term) for term in mpdf.term2.dropna()} - set(terms))
+    if skipped:
+        print(f"No period for terms {', '.join(map(str, skipped))}, their "
+              f"affiliations and relations are left out.")
+    write_root_TEI(template_path, out_file, {
+        "listEvent": iter_list_event(terms),
+        "orgs": iter_orgs(partiesdf),
+        "listPerson": iter_persons(mpdf, partiesdf, terms, additional_persons),
+        "xiincludes": iter_xi_includes(session_dir),
+        "listRelation": iter_list_relation(partiesdf, mpdf, terms),
+        "extent": [format_extent(total.speeches, total.words)],
+        "tagusage": [format_tagusage(total.elements)],
+        "dateFrom": [total.date_from or ""],
+        "dateTo": [total.date_to or ""],
+    })
+    return skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("template")
+    parser.add_argument("out_file")
+    parser.add_argument("--mp", required=True, help="corrected MP table pickle")
+    parser.add_argument("--parties", required=True, help="corrected party table pickle")
+    parser.add_argument("--terms", default=None,
+                        help="terms.csv, taken from the session stats if not given")
+    parser.add_argument("--sessions", required=True)
+    args = parser.parse_args()
+
+    build_root_TEI(pd.read_pickle(args.mp), pd.read_pickle(args.parties),
+                   read_terms(args.terms) if args.terms else None, args.sessions, args.template,
+                   args.out_file)
@@ -0,0 +1,253 @@
+"""Rule-based sentence splitter for Bosnian/Croatian/Serbian, and a harness
+measuring its agreement with the classla splits in existing session files.
+
+The rules follow the standard sentence splitting of the classla `hr`
+tokenizer: a sentence ends after `.`, `!`, `?` or `…` (and any closing
+quotes or brackets right after it) when the next token starts with an
+uppercase letter (possibly after whitespace and opening quotes or dashes),
+or when a digit follows after a space. Abbreviations that never end a
+sentence (titles, months, initials like `A.` or `A.B.`) and ordinals up
+to 9 don't split; after other abbreviations and Roman numerals only an
+uppercase letter starts a new sentence. Only the text around candidate
+punctuation is looked at, so no full tokenization is needed.
+
+Unlike classla (2.2.3), the rules end a sentence after closing quotes and
+brackets (`"Ne." Onda ...` is two sentences), so such utterances count as
+disagreements in the harness.
+
+Transcriber notes (`/PAUZA/`, `/nije uključen mikrofon/`, `____________(?)`)
+are handled as units: punctuation inside them never ends a sentence, and a
+note after sentence-final punctuation starts the next sentence like an
+uppercase word would (`Hvala. /PAUZA/ Nastavljamo.` is two sentences).
+
+Example:
+    python rule_splitter.py /home/rupnik/parlamint/BiH/S/ --limit 50
+"""
+import argparse
+import json
+import re
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Set, Union
+
+# Version of the rules, bump when they change:
+RULES_VERSION = "rules-3"
+
+# Abbreviations (lowercase, without the final period) that never end a
+# sentence:
+NON_FINAL_ABBREVIATIONS = {
+    # Titles and forms of address:
+    "akad", "dipl", "dir", "doc", "dr", "gdin", "gđa", "gđica", "gosp", "ing",
+    "inž", "mag", "mr", "prim", "prof", "spec", "sv", "tehn",
+    # Functions:
+    "ambas", "asist", "potpredsj", "predsj", "zam", "v.d",
+    # Months:
+    "jan", "feb", "febr", "apr", "jun", "jul", "aug", "avg", "sep", "sept",
+    "okt", "dec",
+    # Common shorthands:
+    "al", "cca", "mil", "npr", "n.pr", "tel", "tj", "tzv",
+}
+
+# Abbreviations that may end a sentence. Unlike other words, a number after
+# them (`čl. 5`) does not start a new sentence:
+FINAL_ABBREVIATIONS = {
+    "br", "čl", "d.d", "d.o.o", "god", "itd", "mlrd", "sl", "st", "str", "usp",
+}
+
+# Transcriber notes: a few words between slashes, or a blank for
+# unintelligible speech, possibly with `(?)`:
+_NOTE_PATTERN = r"(?<!\w)/[^\W\d_][^/\n]{0,60}/|_{3,}(?:\(\?\))?"
+_NOTE = re.compile(_NOTE_PATTERN)
+# Closing quotes and brackets that stay with the sentence they end:
+_CLOSING = "\"'»«“”’)]"
+# Candidate punctuation, with closing quotes or brackets if whitespace
+# follows them, and, as the rules need them, what follows it: whitespace,
+# opening quotes or dashes and the first character (or note) after them.
+_CANDIDATE = re.compile(
+    rf"[.!?…]+(?:[{re.escape(_CLOSING)}]+(?=\s|$))?(?=(\s*)([-»\"'„]*)({_NOTE_PATTERN}|.?))")
+_ROMAN_NUMERAL = re.compile(r"[mdclxvi]+", re.IGNORECASE)
+# Token the period belongs to, e.g. `prof`, `SDA-a`, `d.o.o` or `2022`:
+_PREVIOUS_TOKEN = re.compile(
+    r"(?:(?:\w\.)+\w|\d+(?:[.,:/]\d+)*|\w+(?:['@-]\w+)*)$")
+_NUMBER = re.compile(r"\d+(?:[.,:/]\d+)*")
+# Initials, e.g. `A` or `A.B` (of `A.B. Marković`):
+_INITIALS = re.compile(r"(?:[^\W\d_]\.)*[^\W\d_]")
+
+
+def _opening_tokens(opening: str) -> int:
+    """Number of tokens in a run of opening quotes and dashes (`""-` is 2)."""
+    return sum(1 for i, c in enumerate(opening) if i == 0 or c != opening[i - 1])
+
+
+def _uppercase_follows(space: str, opening: str, first: str) -> bool:
+    """Whether the next sentence seems to start after the punctuation."""
+    if not first.isupper() and len(first) < 2:
+        # Neither an uppercase letter nor a note:
+        return False
+    # At most one opening token right after the punctuation, or two after
+    # whitespace:
+    return not opening or _opening_tokens(opening) <= (2 if space else 1)
+
+
+def _is_boundary(line: str, match: "re.Match") -> bool:
+    space, opening, first = match.groups()
+    if not first:
+        return False
+    start = match.start()
+    if match.group(0).rstrip(_CLOSING) == "." and start and line[start - 1].isalnum():
+        # Tokens are short, only look back to the last space:
+        chunk = line[line.rfind(" ", 0, start) + 1:start]
+        word = _PREVIOUS_TOKEN.search(chunk).group(0)
+        if _NUMBER.fullmatch(word):
+            # Ordinals up to 9 never end a sentence, others may:
+            return len(word) > 1 and _uppercase_follows(space, opening, first)
+        key = word.lower()
+        if (len(word) == 1 or key in NON_FINAL_ABBREVIATIONS
+                or (word.isupper() and _INITIALS.fullmatch(word))):
+            return False
+        if key in FINAL_ABBREVIATIONS or _ROMAN_NUMERAL.fullmatch(word):
+            return _uppercase_follows(space, opening, first)
+    if _uppercase_follows(space, opening, first):
+        return True
+    # A number after the punctuation, e.g. `Hvala. 2. tačka ...`:
+    return bool(space) and not opening and first.isdigit()
+
+
+def split_sentences_rules(s: str) -> List[str]:
+    """Splits a text into sentences with the rules described above.
+
+    Like classla, sentences never cross line breaks and keep the text's
+    own spacing.
+
+    Args:
+        s (str): text to split
+
+    Returns:
+        List[str]: sentences.
+    """
+    sentences = []
+    for line in s.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        start = 0
+        notes = [m.span() for m in _NOTE.finditer(line)] \
+            if "/" in line or "___" in line else []
+        for match in _CANDIDATE.finditer(line):
+            if notes and any(a < match.start() < b for a, b in notes):
+                continue
+            if _is_boundary(line, match):
+                sentences.append(line[start:match.end()].strip())
+                start = match.end()
+        rest = line[start:].strip()
+        if rest:
+            sentences.append(rest)
+    return sentences
+
+
+def _boundaries(sentences: List[str]) -> Set[int]:
+    """Sentence ends as counts of non-whitespace characters."""
+    ends, position = set(), 0
+    for sentence in sentences[:-1]:
+        position += sum(1 for c in sentence if not c.isspace())
+        ends.add(position)
+    return ends
+
+
+def iter_session_utterances(path: Union[str, Path]) -> Iterator[List[str]]:
+    """Yields the `seg` texts of every `u` in a session file."""
+    from xml.etree.ElementTree import iterparse
+
+    namespace = "{http://www.tei-c.org/ns/1.0}"
+    for event, element in iterparse(str(path), events=("end",)):
+        if element.tag == f"{namespace}u":
+            yield [seg.text or "" for seg in element.iter(f"{namespace}seg")]
+            element.clear()
+
+
+def agreement(reference: Iterable[List[str]],
+              predicted: Iterable[List[str]]) -> Dict[str, float]:
+    """Compares two splits of the same utterances.
+
+    Returns:
+        Dict[str, float]: share of utterances split identically and
+            precision/recall/F1 of the predicted sentence boundaries.
+    """
+    utterances = identical = true_positives = n_reference = n_predicted = 0
+    for ref, pred in zip(reference, predicted):
+        ref_ends, pred_ends = _boundaries(ref), _boundaries(pred)
+        utterances += 1
+        identical += ref_ends == pred_ends
+        true_positives += len(ref_ends & pred_ends)
+        n_reference += len(ref_ends)
+        n_predicted += len(pred_ends)
+    precision = true_positives / n_predicted if n_predicted else 1.0
+    recall = true_positives / n_reference if n_reference else 1.0
+    return {
+        "utterances": utterances,
+        "identical": identical / utterances if utterances else float("nan"),
+        "boundary_precision": precision,
+        "boundary_recall": recall,
+        "boundary_f1": 2 * precision * recall / (precision + recall)
+        if precision + recall else 0.0,
+    }
+
+
+def evaluate_sessions(session_files: Iterable[Union[str, Path]],
+                      examples: int = 10) -> Dict:
+    """Measures how well `split_sentences_rules` agrees with classla.
+
+    The classla splits are taken from the `seg` elements of already built
+    session files; each utterance is rebuilt by joining its segments with a
+    space and split again with the rules.
+
+    Args:
+        session_files (Iterable[Union[str, Path]]): session TEI files
+        examples (int, optional): number of disagreements to include.
+            Defaults to 10.
+
+    Returns:
+        Dict: `agreement` scores, the rules' throughput and examples of
+            utterances split differently. `notes` has the scores of the
+            utterances with transcriber notes alone, and examples of them.
+    """
+    reference, predicted, disagreements = [], [], []
+    with_notes, note_disagreements = [], []
+    characters, elapsed = 0, 0.0
+    for path in session_files:
+        for segments in iter_session_utterances(path):
+            text = " ".join(segments)
+            start = perf_counter()
+            sentences = split_sentences_rules(text)
+            elapsed += perf_counter() - start
+            characters += len(text)
+            reference.append(segments)
+            predicted.append(sentences)
+            differ = _boundaries(segments) != _boundaries(sentences)
+            if len(disagreements) < examples and differ:
+                disagreements.append({"classla": segments, "rules": sentences})
+            if _NOTE.search(text):
+                with_notes.append(len(reference) - 1)
+                if len(note_disagreements) < examples and differ:
+                    note_disagreements.append({"classla": segments, "rules": sentences})
+    result = agreement(reference, predicted)
+    result["notes"] = agreement([reference[i] for i in with_notes],
+                                [predicted[i] for i in with_notes])
+    result["notes"]["disagreements"] = note_disagreements
+    result["rules_s"] = elapsed
+    result["rules_chars_per_s"] = characters / elapsed if elapsed else float("nan")
+    result["disagreements"] = disagreements
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("session_dir")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="only evaluate the first LIMIT sessions")
+    parser.add_argument("--examples", type=int, default=10)
+    args = parser.parse_args()
+
+    files = sorted(Path(args.session_dir).glob("ParlaMint-BA_T*.xml"))[:args.limit]
+    print(json.dumps(evaluate_sessions(files, args.examples),
+                     indent=1, ensure_ascii=False))
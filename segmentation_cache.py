@@ -0,0 +1,190 @@
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+
+def get_model_version() -> str:
+    """Version string of the installed classla, used in cache keys."""
+    import classla
+    return f"classla-{classla.__version__}"
+
+
+class SegmentationCache:
+    """On-disk cache of sentence splits, keyed by a hash of the text.
+
+    Keys combine the utterance text with the tokenizer language and model
+    version, so upgrading classla or switching languages never returns
+    stale splits. Entries are kept in a SQLite file; once the stored
+    sentences exceed `max_bytes`, the least recently used entries are
+    evicted. The total size is kept up to date by triggers, so checking it
+    doesn't scan the table, and hits refresh `last_used` in batches of
+    `touch_batch` (see `flush`).
+
+    `model_version` defaults to the installed classla's, which imports
+    classla; pass it when classla isn't used.
+
+    Example:
+        cache = SegmentationCache("/home/rupnik/parlamint/BiH/segments.sqlite")
+        prepare_interim_files(..., cache=cache)
+        print(cache.hits, cache.misses)
+    """
+
+    def __init__(self, path: Union[str, Path], language: str = "hr",
+                 model_version: Optional[str] = None,
+                 max_bytes: int = 2 * 1024**3,
+                 touch_batch: int = 1000) -> None:
+        self.path = str(path)
+        self.language = language
+        self.model_version = model_version or get_model_version()
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        # Keys of hits whose `last_used` is not written yet:
+        self._touched: Dict[str, float] = {}
+        self._connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._transaction():
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS segments (
+                    key TEXT PRIMARY KEY,
+                    sentences TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS segments_last_used ON segments(last_used)")
+            # Running total of `size`; caches from before it are counted once:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS totals (size INTEGER NOT NULL)")
+            if self._connection.execute("SELECT COUNT(*) FROM totals").fetchone()[0] == 0:
+                self._connection.execute(
+                    "INSERT INTO totals SELECT COALESCE(SUM(size), 0) FROM segments")
+            self._connection.execute(
+                """CREATE TRIGGER IF NOT EXISTS segments_insert AFTER INSERT ON segments
+                   BEGIN UPDATE totals SET size = size + NEW.size; END""")
+            self._connection.execute(
+                """CREATE TRIGGER IF NOT EXISTS segments_delete AFTER DELETE ON segments
+                   BEGIN UPDATE totals SET size = size - OLD.size; END""")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def key(self, text: str) -> str:
+        h = hashlib.sha256()
+        for part in (self.language, self.model_version, text):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def get_many(self, texts: Iterable[str]) -> Dict[str, List[str]]:
+        """Looks up texts, returning splits for those that are cached."""
+        by_key = {self.key(t): t for t in texts}
+        found = {}
+        keys = list(by_key)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._connection.execute(
+                f"SELECT key, sentences FROM segments WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk).fetchall()
+            for key, sentences in rows:
+                found[key] = json.loads(sentences)
+        now = time.time()
+        self._touched.update((key, now) for key in found)
+        if len(self._touched) >= self.touch_batch:
+            self.flush()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return {by_key[key]: sentences for key, sentences in found.items()}
+
+    def get(self, text: str) -> Optional[List[str]]:
+        return self.get_many([text]).get(text)
+
+    def flush(self) -> None:
+        """Writes the pending `last_used` updates of hits in one transaction.
+
+        Also done every `touch_batch` hits, on `put_many` and on `close`;
+        pending updates lost with the process only affect eviction order.
+        """
+        if not self._touched:
+            return
+        with self._transaction():
+            self._connection.executemany(
+                "UPDATE segments SET last_used = ? WHERE key = ?",
+                [(now, key) for key, now in self._touched.items()])
+        self._touched.clear()
+
+    def put_many(self, splits: Dict[str, List[str]]) -> None:
+        """Stores splits and evicts old entries if the cache is over budget."""
+        now = time.time()
+        rows = []
+        for text, sentences in splits.items():
+            value = json.dumps(sentences, ensure_ascii=False)
+            rows.append((self.key(text), value, len(value.encode("utf-8")), now))
+        self.flush()
+        with self._transaction():
+            # A key always maps to the same split, so existing rows are kept:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO segments VALUES (?, ?, ?, ?)", rows)
+        if self.size() > self.max_bytes:
+            self.evict()
+
+    def put(self, text: str, sentences: List[str]) -> None:
+        self.put_many({text: sentences})
+
+    def size(self) -> int:
+        """Total size of the stored sentences in bytes."""
+        return self._connection.execute("SELECT size FROM totals").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drops least recently used entries until under `max_bytes`.
+
+        Returns:
+            int: number of evicted entries.
+        """
+        self.flush()
+        evicted = 0
+        with self._transaction():
+            excess = self.size() - self.max_bytes
+            while excess > 0:
+                rows = self._connection.execute(
+                    "SELECT key, size FROM segments ORDER BY last_used LIMIT 1000"
+                ).fetchall()
+                if not rows:
+                    break
+                to_delete = []
+                for key, size in rows:
+                    if excess <= 0:
+                        break
+                    to_delete.append((key,))
+                    excess -= size
+                self._connection.executemany(
+                    "DELETE FROM segments WHERE key = ?", to_delete)
+                evicted += len(to_delete)
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        entries = self._connection.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": entries, "bytes": self.size()}
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self) -> "SegmentationCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
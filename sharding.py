@@ -0,0 +1,108 @@
+"""Splits whole-term meta/text dumps into per-session files.
+
+Example:
+    python sharding.py /home/rupnik/parlamint/BiH/
+"""
+import argparse
+from pathlib import Path
+from typing import List, Optional, Union
+
+from utils import parse_meta_file, parse_text_file
+
+# Misspellings of "sjednica" found in the session names:
+SESSION_NAME_FIXES = {
+    "sjdenica": "sjednica",
+    "sjedica": "sjednica",
+    "sjedinca": "sjednica",
+}
+
+
+def fix_session_name(name: str) -> str:
+    for wrong, right in SESSION_NAME_FIXES.items():
+        name = name.replace(wrong, right)
+    return name
+
+
+def shard_term(meta_path: Union[str, Path], text_path: Union[str, Path],
+               outdir: Union[str, Path]) -> List[Path]:
+    """Writes `meta_*.tsv`/`text_*.txt` pairs for every session of a term.
+
+    Meta and text are joined once and split with a single `groupby`, so the
+    cost is linear in the size of the term. Sessions without any text are
+    skipped. Sessions whose names are the same once misspellings are fixed
+    (see `fix_session_name`) are written to one pair of files.
+
+    Args:
+        meta_path (Union[str, Path]): whole-term metadata
+        text_path (Union[str, Path]): whole-term text
+        outdir (Union[str, Path]): output directory
+
+    Returns:
+        List[Path]: written metadata files.
+    """
+    outdir = Path(outdir)
+    metadf = parse_meta_file(meta_path)
+    textdf = parse_text_file(text_path)
+    term = metadf.Term.unique()
+    assert len(term) == 1, "More than one term in file!"
+    term = int(term[0])
+
+    # Inner merge keeps the order of the text file; an ID listed in several
+    # sessions goes to each of them:
+    textdf = textdf.merge(metadf[["ID", "Session"]].drop_duplicates(), on="ID")
+    # Sessions whose names only differ by a misspelling share a file:
+    filenames = {session: fix_session_name(f"meta_T{term:02}_S{session}.tsv")
+                 for session in metadf.Session.unique()}
+    text_groups = dict(iter(textdf.groupby(textdf.Session.map(filenames), sort=False)))
+
+    written = []
+    for filename, subset in metadf.groupby(metadf.Session.map(filenames), sort=False):
+        textsubset = text_groups.get(filename)
+        # Skip if we have no texts for session:
+        if textsubset is None:
+            continue
+        if subset.Session.nunique() > 1:
+            # Merged sessions, keep utterances listed in both once:
+            subset = subset.drop_duplicates("ID")
+            textsubset = textsubset.drop_duplicates("ID")
+        meta_file = outdir / filename
+        subset.to_csv(meta_file, sep="\t", index=False)
+        with open(outdir / filename.replace("meta", "text").replace("tsv", "txt"),
+                  "w", encoding="utf-8") as f:
+            f.write("".join(
+                f"{ID} {text}\n"
+                for ID, text in zip(textsubset.ID, textsubset.Text)
+            ))
+        written.append(meta_file)
+    return written
+
+
+def shard_corpus(location: Union[str, Path],
+                 outdir: Optional[Union[str, Path]] = None) -> List[Path]:
+    """Shards every `*_meta.tsv`/`*_text.txt` term pair in `location`.
+
+    Args:
+        location (Union[str, Path]): directory with the term dumps
+        outdir (Union[str, Path], optional): output directory. Defaults to
+            `location/S_data`.
+
+    Returns:
+        List[Path]: written metadata files.
+    """
+    location = Path(location)
+    outdir = Path(outdir) if outdir is not None else location / "S_data"
+    outdir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for meta_path in sorted(location.glob("*_meta.tsv")):
+        text_path = meta_path.with_name(
+            meta_path.name.replace("meta", "text").replace(".tsv", ".txt"))
+        written.extend(shard_term(meta_path, text_path, outdir))
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("location")
+    parser.add_argument("--outdir", default=None)
+    args = parser.parse_args()
+    print(f"Wrote {len(shard_corpus(args.location, args.outdir))} sessions.")
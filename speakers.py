@@ -0,0 +1,119 @@
+import pickle
+import re
+import unicodedata
+from difflib import get_close_matches
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+ADDITIONAL_PERSONS_PATH = Path(__file__).with_name("005_additional_persons.pickle")
+IGNORE_KEYS_PATH = Path(__file__).with_name("005_ignore_keys.pickle")
+
+_PARENTHESES = re.compile(r"\(.*?\)")
+
+
+def reference_name(fullname: str) -> str:
+    """Person ID used in the root TEI, e.g. `Lučić, Miloš` -> `LučićMiloš`."""
+    return "".join(fullname.split()).replace(",", "").replace(" ", "").replace("–", "-")
+
+
+def normalize_name(name: str) -> str:
+    """Key for exact lookups: no spaces, commas or remarks like `(lord)`."""
+    name = _PARENTHESES.sub("", name)
+    name = name.replace("–", "-").replace("—", "-").replace(",", "")
+    return unicodedata.normalize("NFC", "".join(name.split())).casefold()
+
+
+def strip_diacritics(name: str) -> str:
+    name = name.replace("đ", "dj").replace("Đ", "Dj")
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class SpeakerRegistry:
+    """Resolves `u/@who` references against the known persons.
+
+    Names are looked up by their normalized form first, then without
+    diacritics and finally by fuzzy matching. Each distinct name is only
+    resolved once. Names of non-persons (`Protocol`, `Predstavnik`, ...)
+    are ignored, and for joint entries like `LučićMiloš;JovićNedeljko`
+    the first resolvable person is used. Fuzzy and joint resolutions are
+    guesses; `match` tells them apart from exact ones.
+
+    Example:
+        speakers = SpeakerRegistry.from_tables(mpdf)
+        speakers.resolve("DžonsonRasel(lord)")  # -> "DžonsonRasel"
+    """
+
+    def __init__(self, person_ids: Iterable[str], ignored: Iterable[str] = (),
+                 fuzzy_cutoff: float = 0.9) -> None:
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._exact: Dict[str, str] = {}
+        self._plain: Dict[str, str] = {}
+        for person_id in person_ids:
+            key = normalize_name(person_id)
+            self._exact.setdefault(key, person_id)
+            self._plain.setdefault(strip_diacritics(key), person_id)
+        self._plain_keys = list(self._plain)
+        self._ignored = {normalize_name(i) for i in ignored}
+        self._resolved: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+
+    @classmethod
+    def from_tables(cls, mpdf: pd.DataFrame,
+                    additional_persons_path: Union[str, Path] = ADDITIONAL_PERSONS_PATH,
+                    ignore_keys_path: Union[str, Path] = IGNORE_KEYS_PATH,
+                    **kwargs) -> "SpeakerRegistry":
+        """Builds the registry from the MP table and the 005 pickles.
+
+        Args:
+            mpdf (pd.DataFrame): MP table with a `fullname` column
+            additional_persons_path (Union[str, Path], optional): pickled
+                list of `person` elements added to the root TEI by hand.
+            ignore_keys_path (Union[str, Path], optional): pickled list of
+                names that are not persons.
+        """
+        person_ids = [reference_name(i) for i in mpdf.fullname.dropna().unique()]
+        with open(additional_persons_path, "rb") as f:
+            person_ids += [p.get("xml:id") for p in pickle.load(f)]
+        with open(ignore_keys_path, "rb") as f:
+            ignored = pickle.load(f)
+        return cls(person_ids, ignored, **kwargs)
+
+    def ignores(self, name: str) -> bool:
+        return normalize_name(name) in self._ignored
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Returns the person ID for a speaker name, or None if unknown."""
+        return self.match(name)[0]
+
+    def match(self, name: str) -> Tuple[Optional[str], Optional[str]]:
+        """Returns the person ID for a speaker name and how it was found.
+
+        Returns:
+            Tuple[Optional[str], Optional[str]]: person ID and `exact`,
+                `diacritics` or `fuzzy`, prefixed with `joint ` if the name
+                lists several speakers; (None, None) if unknown.
+        """
+        if name not in self._resolved:
+            self._resolved[name] = self._resolve(name)
+        return self._resolved[name]
+
+    def _resolve(self, name: str) -> Tuple[Optional[str], Optional[str]]:
+        parts = [key for key in map(normalize_name, name.split(";")) if key]
+        prefix = "joint " if len(parts) > 1 else ""
+        for key in parts:
+            if key in self._exact:
+                return self._exact[key], prefix + "exact"
+            plain = strip_diacritics(key)
+            if plain in self._plain:
+                return self._plain[plain], prefix + "diacritics"
+            close = get_close_matches(plain, self._plain_keys, n=1,
+                                      cutoff=self.fuzzy_cutoff)
+            if close:
+                return self._plain[close[0]], prefix + "fuzzy"
+        return None, None
+
+    def unresolved(self, names: Iterable[str]) -> List[str]:
+        return sorted({n for n in names
+                       if not self.ignores(n) and self.resolve(n) is None})
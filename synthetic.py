@@ -0,0 +1,278 @@
+"""Generates a synthetic ParlaMint-BA corpus for benchmarks and tests.
+
+Writes `S_data/` with `meta_*.tsv`/`text_*.txt` session pairs, MP and party
+workbooks and a root template, all shaped like the real data (the same
+columns, file names, ID formats, transcriber notes and abbreviations),
+at any scale. `use_stub_pipeline` replaces classla with a naive splitter,
+so everything runs offline.
+
+Example:
+    python synthetic.py /tmp/synthetic --terms 7 8 --sessions 20 --utterances 800
+"""
+import argparse
+import random
+import re
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Sequence, Union
+
+import pandas as pd
+
+FIRST_NAMES = ["Miloš", "Nedeljko", "Šefik", "Zlatko", "Mirko", "Ivo", "Branko",
+               "Halid", "Adnan", "Mediha", "Munira", "Anita", "Raifa", "Radenka",
+               "Milenka", "Ana", "Denis", "Saša", "Dragan", "Jasmin"]
+LAST_NAMES = ["Lučić", "Jović", "Džaferović", "Lagumdžija", "Baković", "Divković",
+              "Dokić", "Genjac", "Jahić", "Filipović", "Karić", "Mikulić",
+              "Alagić", "Balta", "Bošnjak", "Zvizdić", "Bećirović", "Čović",
+              "Radmanović", "Šarović"]
+PARTIES = [("SDA", "Stranka demokratske akcije"),
+           ("SDP BiH", "Socijaldemokratska partija Bosne i Hercegovine"),
+           ("SNSD", "Savez nezavisnih socijaldemokrata"),
+           ("SDS", "Srpska demokratska stranka"),
+           ("HDZ BiH", "Hrvatska demokratska zajednica Bosne i Hercegovine"),
+           ("SBB", "Savez za bolju budućnost BiH"),
+           ("DF", "Demokratska fronta"),
+           ("PDP", "Partija demokratskog progresa")]
+WORDS = ("zakon prijedlog poslanik sjednica dnevni red tačka amandman vijeće "
+         "ministara budžet Bosne i Hercegovine komisija izvještaj mišljenje "
+         "glasanje rasprava rješenje država entitet građani institucije "
+         "odluka usvajanje čitanje postupak reforma ekonomija pitanje").split()
+OPENINGS = ["Hvala, predsjedavajući.", "Dobar dan.", "Poštovane kolegice i kolege,",
+            "Izvolite.", "Ja bih samo kratko."]
+NOTES = ["/PAUZA/", "/nije uključen mikrofon/", "____________(?)", "(aplauz)"]
+ABBREVIATIONS = ["npr.", "tj.", "dr.", "prof.", "čl.", "br.", "itd."]
+SESSION_SUFFIXES = ["sjednica"] * 6 + ["nastavak", "hitna", "vanredna"]
+
+# Columns of the real metadata files:
+META_COLUMNS = ["ID", "Title", "From", "To", "House", "Term", "Session", "Meeting",
+                "Sitting", "Agenda", "Subcorpus", "Speaker_role", "Speaker_type",
+                "Speaker_party", "Speaker_party_name", "Party_status",
+                "Speaker_name", "Speaker_gender", "Speaker_birth", "Codemp",
+                "Codeparty"]
+
+ROOT_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<teiCorpus xmlns="http://www.tei-c.org/ns/1.0" xml:lang="bs" xml:id="ParlaMint-BA">
+  <teiHeader>
+    <fileDesc>
+      <extent>
+$extent
+      </extent>
+    </fileDesc>
+    <encodingDesc>
+      <tagsDecl>
+        <namespace name="http://www.tei-c.org/ns/1.0">
+$tagusage
+        </namespace>
+      </tagsDecl>
+    </encodingDesc>
+    <profileDesc>
+      <settingDesc>
+        <setting>
+          <date from="$dateFrom" to="$dateTo">$dateFrom - $dateTo</date>
+        </setting>
+      </settingDesc>
+      <particDesc>
+        <listOrg>
+          <org xml:id="PS" role="parliament">
+            <listEvent>
+$listEvent
+            </listEvent>
+          </org>
+$orgs
+$listRelation
+        </listOrg>
+        <listPerson>
+$listPerson
+        </listPerson>
+      </particDesc>
+    </profileDesc>
+  </teiHeader>
+$xiincludes
+</teiCorpus>
+"""
+
+
+# Sentence end of `StubPipeline`: final punctuation, whitespace and an
+# uppercase letter, possibly after an opening quote or dash:
+_STUB_BOUNDARY = re.compile(r"(?<=[.!?…])\s+(?=[\"'„»-]?[A-ZČĆŽŠĐ])")
+
+
+class StubPipeline:
+    """Stands in for the classla tokenizer with a naive splitter.
+
+    It knows no abbreviations or transcriber notes and is independent of
+    `rule_splitter`, so comparing the two on synthetic data doesn't compare
+    the rules with themselves; neither comparison says anything about
+    agreement with classla.
+    """
+
+    def process(self, text: str) -> SimpleNamespace:
+        sentences = [sentence for line in text.split("\n") if line.strip()
+                     for sentence in _STUB_BOUNDARY.split(line.strip())]
+        return SimpleNamespace(sentences=[SimpleNamespace(text=s) for s in sentences])
+
+
+def use_stub_pipeline() -> None:
+    """Makes `utils.get_pipeline` return a `StubPipeline` instead of classla."""
+    import utils
+    utils.pipeline = StubPipeline()
+
+
+def term_years(term: int) -> int:
+    """First year of a term, e.g. 2014 for term 7."""
+    return 1986 + 4 * term
+
+
+def mp_table(rng: random.Random, terms: Sequence[int], mps_per_term: int) -> pd.DataFrame:
+    """MPs of every term; about half of them sit in more than one term."""
+    people = [(f"{last}, {first}", last, first)
+              for last in LAST_NAMES for first in FIRST_NAMES]
+    rng.shuffle(people)
+    people = people[:max(mps_per_term * len(terms) * 2 // 3, mps_per_term)]
+    rows = []
+    for term in terms:
+        start = term_years(term)
+        for fullname, last, first in rng.sample(people, mps_per_term):
+            year = rng.randint(1940, 1985)
+            rows.append({
+                # Like the real table, some MPs have no code:
+                "codemp": f"RE{people.index((fullname, last, first)) + 1}"
+                if rng.random() > 0.05 else None,
+                "term1": f"{start}-{start + 4}", "term2": term,
+                "house": "ZD", "fullname": fullname, "lastname": last,
+                "firstname": first, "gender": int(first.endswith("a")),
+                "date_of_birth": f"{year}{rng.randint(1, 12):02}{rng.randint(1, 28):02}"
+                if rng.random() > 0.2 else "-",
+                "year_of_birth": str(year),
+                "party": rng.choice(PARTIES)[0] if rng.random() > 0.03 else None,
+            })
+    return pd.DataFrame(rows)
+
+
+def parties_table(terms: Sequence[int]) -> pd.DataFrame:
+    rows = []
+    for term in terms:
+        start = term_years(term)
+        for i, (party, full_name) in enumerate(PARTIES):
+            rows.append({"codeparty": i + 1, "term1": f"{start}-{start + 4}",
+                         "term2": term, "party": party, "full_name": full_name,
+                         "coalition": int(i < 3), "ruling": int(i < 3)})
+    return pd.DataFrame(rows)
+
+
+def utterance(rng: random.Random, max_sentences: int = 12) -> str:
+    parts = []
+    if rng.random() < 0.3:
+        parts.append(rng.choice(OPENINGS))
+    for _ in range(rng.randint(1, max_sentences)):
+        words = rng.choices(WORDS, k=rng.randint(3, 25))
+        if rng.random() < 0.15:
+            words.insert(rng.randrange(len(words)), rng.choice(ABBREVIATIONS))
+        if rng.random() < 0.1:
+            words.insert(rng.randrange(len(words)), f"{rng.randint(1, 120)}.")
+        sentence = " ".join(words)
+        parts.append(sentence[0].upper() + sentence[1:] + rng.choice(".....?!"))
+    if rng.random() < 0.1:
+        parts.insert(rng.randrange(len(parts) + 1), rng.choice(NOTES))
+    return " ".join(parts)
+
+
+def write_session(datadir: Path, term: int, session: int, suffix: str,
+                  n_utterances: int, mps: pd.DataFrame, rng: random.Random,
+                  duplicate_rate: float = 0.01) -> List[Path]:
+    """Writes the meta/text pair of one session.
+
+    Returns:
+        List[Path]: text and meta file.
+    """
+    year = term_years(term) + rng.randint(0, 3)
+    date = f"{year}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}"
+    chair = mps.sample(1, random_state=rng.randint(0, 2**31)).iloc[0]
+    speakers = mps.sample(min(len(mps), 20), random_state=rng.randint(0, 2**31))
+    texts, metas = [], []
+    for u in range(1, n_utterances + 1):
+        is_chair = rng.random() < 0.3
+        mp = chair if is_chair else speakers.iloc[rng.randrange(len(speakers))]
+        text = texts[-1][1] if texts and rng.random() < duplicate_rate else utterance(rng)
+        utterance_id = f"ParlaMint-BA_T{term:02}.S{session}.u{u}"
+        texts.append((utterance_id, text))
+        metas.append({
+            "ID": utterance_id, "Title": f"Sjednica {session}", "From": date,
+            "To": date, "House": "Predstavnički dom", "Term": term,
+            "Session": f"{session}. {suffix}", "Meeting": "-", "Sitting": "-",
+            "Agenda": "-", "Subcorpus": "Reference",
+            "Speaker_role": "Chairperson" if is_chair else "Regular",
+            "Speaker_type": "MP",
+            "Speaker_party": "-" if pd.isna(mp.party) else mp.party,
+            "Speaker_party_name": "-", "Party_status": "-",
+            "Speaker_name": mp.fullname,
+            "Speaker_gender": "F" if mp.gender else "M",
+            "Speaker_birth": mp.year_of_birth,
+            "Codemp": "" if pd.isna(mp.codemp) else mp.codemp,
+            "Codeparty": "-",
+        })
+    text_path = datadir / f"text_T{term:02}_S{session}. {suffix}.txt"
+    meta_path = datadir / f"meta_T{term:02}_S{session}. {suffix}.tsv"
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.writelines(f"{i}\t{t}\n" for i, t in texts)
+    pd.DataFrame(metas, columns=META_COLUMNS).to_csv(meta_path, sep="\t", index=False)
+    return [text_path, meta_path]
+
+
+def generate_corpus(outdir: Union[str, Path], terms: Sequence[int] = (7,),
+                    sessions_per_term: int = 10, utterances_per_session: int = 500,
+                    mps_per_term: int = 42, duplicate_rate: float = 0.01,
+                    seed: int = 0) -> Dict[str, Path]:
+    """Writes a synthetic corpus.
+
+    Session sizes vary around `utterances_per_session`, like the real ones.
+
+    Args:
+        outdir (Union[str, Path]): output directory
+        terms (Sequence[int], optional): terms to generate. Defaults to (7,).
+        sessions_per_term (int, optional): Defaults to 10.
+        utterances_per_session (int, optional): mean session size. Defaults to 500.
+        mps_per_term (int, optional): Defaults to 42, the size of the House.
+        duplicate_rate (float, optional): share of utterances repeating the
+            previous one. Defaults to 0.01.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        Dict[str, Path]: `datadir`, `mp`, `parties` and `template` paths.
+    """
+    rng = random.Random(seed)
+    outdir = Path(outdir)
+    datadir = outdir / "S_data"
+    datadir.mkdir(parents=True, exist_ok=True)
+    mpdf = mp_table(rng, terms, mps_per_term)
+    partiesdf = parties_table(terms)
+    for term in terms:
+        mps = mpdf[mpdf.term2 == term]
+        for session in range(1, sessions_per_term + 1):
+            n = max(1, int(rng.gauss(utterances_per_session, utterances_per_session / 3)))
+            write_session(datadir, term, session, rng.choice(SESSION_SUFFIXES), n,
+                          mps, rng, duplicate_rate)
+    paths = {"datadir": datadir, "mp": outdir / "BiH_MPs_synthetic.xlsx",
+             "parties": outdir / "BiH_electoral_lists_synthetic.xlsx",
+             "template": outdir / "ParlaMint-BA_template.xml"}
+    mpdf.to_excel(paths["mp"], index=False)
+    partiesdf.to_excel(paths["parties"], index=False)
+    paths["template"].write_text(ROOT_TEMPLATE, encoding="utf-8")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("outdir")
+    parser.add_argument("--terms", type=int, nargs="+", default=[7])
+    parser.add_argument("--sessions", type=int, default=10, help="sessions per term")
+    parser.add_argument("--utterances", type=int, default=500,
+                        help="mean utterances per session")
+    parser.add_argument("--mps", type=int, default=42, help="MPs per term")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.outdir, args.terms, args.sessions, args.utterances,
+                            args.mps, seed=args.seed)
+    for name, path in paths.items():
+        print(f"{name}: {path}")
@@ -0,0 +1,147 @@
+import re
+
+import pytest
+
+
+def _fail():
+    raise RuntimeError("no model")
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_failing_worker_start_is_recorded(tmp_path, monkeypatch, max_workers):
+    import annotate
+
+    session_dir = tmp_path / "S"
+    session_dir.mkdir()
+    for name in ("ParlaMint-BA_T07S1.xml", "ParlaMint-BA_T07S2.xml"):
+        (session_dir / name).write_text("<TEI/>\n", encoding="utf-8")
+    monkeypatch.setattr(annotate, "annotation_inputs", lambda f: {"session": f.name})
+    monkeypatch.setattr(annotate, "get_annotation_pipeline", _fail)
+    monkeypatch.setattr(annotate, "init_worker", _fail)
+
+    results = annotate.annotate_corpus(session_dir, tmp_path / "ana",
+                                       max_workers=max_workers, group_bytes=1)
+
+    assert sorted(name for r in results for name in r["sessions"]) == [
+        "ParlaMint-BA_T07S1.xml", "ParlaMint-BA_T07S2.xml"]
+    assert all(r["error"] is not None for r in results)
+    assert (tmp_path / "ana" / "annotation_manifest.json").exists()
+
+
+def test_render_seg():
+    from annotate import render_seg
+
+    tokens = [
+        ("Miloš", "Miloš", "PROPN", "Npmsn", "Case=Nom", "B-PER", True),
+        ("Lučić", "Lučić", "PROPN", "Npmsn", "Case=Nom", "I-PER", True),
+        ("je", "biti", "AUX", "Var3s", None, "O", True),
+        ("tu", "tu", "ADV", "Rgp", None, None, False),
+        ("!", "!", "PUNCT", "Z", None, "O", False),
+    ]
+    counts = {"w": 0, "pc": 0, "name": 0}
+
+    xml = render_seg("ParlaMint-BA_T07.S1.u1.s0", tokens, 2, counts)
+
+    assert xml == (
+        '\t\t<seg xml:id="ParlaMint-BA_T07.S1.u1.s0">\n'
+        '\t\t\t<name type="PER">\n'
+        '\t\t\t\t<w xml:id="ParlaMint-BA_T07.S1.u1.s0.1" lemma="Miloš" '
+        'msd="UPosTag=PROPN|Case=Nom" ana="mte:Npmsn">Miloš</w>\n'
+        '\t\t\t\t<w xml:id="ParlaMint-BA_T07.S1.u1.s0.2" lemma="Lučić" '
+        'msd="UPosTag=PROPN|Case=Nom" ana="mte:Npmsn">Lučić</w>\n'
+        '\t\t\t</name>\n'
+        '\t\t\t<w xml:id="ParlaMint-BA_T07.S1.u1.s0.3" lemma="biti" '
+        'msd="UPosTag=AUX" ana="mte:Var3s">je</w>\n'
+        '\t\t\t<w xml:id="ParlaMint-BA_T07.S1.u1.s0.4" lemma="tu" '
+        'msd="UPosTag=ADV" ana="mte:Rgp" join="right">tu</w>\n'
+        '\t\t\t<pc xml:id="ParlaMint-BA_T07.S1.u1.s0.5" msd="UPosTag=PUNCT" '
+        'ana="mte:Z">!</pc>\n'
+        '\t\t</seg>\n')
+    assert counts == {"w": 4, "pc": 1, "name": 1}
+
+
+class _StubAnnotationPipeline:
+    """Tokenizes on words and punctuation; tags `Sarajevo` as a location."""
+
+    def __init__(self):
+        self.calls = []
+
+    def process(self, text):
+        from types import SimpleNamespace
+
+        self.calls.append(text)
+        sentences = []
+        for part in text.split("\n\n"):
+            tokens = []
+            for match in re.finditer(r"\w+|[^\w\s]", part):
+                space_after = part[match.end():match.end() + 1].isspace()
+                word = SimpleNamespace(
+                    text=match.group(), lemma=match.group().lower(),
+                    upos="PUNCT" if not match.group().isalnum() else "X",
+                    xpos="Z" if not match.group().isalnum() else "X", feats=None)
+                tokens.append(SimpleNamespace(
+                    words=[word], misc=None if space_after else "SpaceAfter=No",
+                    ner="B-LOC" if match.group().startswith("Sarajev") else "O"))
+            sentences.append(SimpleNamespace(text=part, tokens=tokens))
+        return SimpleNamespace(sentences=sentences)
+
+
+SESSION = """<?xml version="1.0" ?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:id="{name}" xml:lang="bs">
+\t<teiHeader>
+\t\t<extent>
+\t\t\t<measure unit="words" quantity="9" xml:lang="bs">9 riječi</measure>
+\t\t\t<measure unit="words" quantity="9" xml:lang="en">9 words</measure>
+\t\t</extent>
+\t\t<namespace name="http://www.tei-c.org/ns/1.0">
+\t\t\t<tagUsage gi="seg" occurs="2"/>
+\t\t</namespace>
+\t</teiHeader>
+\t<text>
+\t\t<body>
+\t\t\t<u xml:id="{id}.u1">
+\t\t\t\t<seg xml:id="{id}.u1.s0">Dobar dan, Sarajevo!</seg>
+\t\t\t\t<seg xml:id="{id}.u1.s1">Prvi red
+drugi red.</seg>
+\t\t\t</u>
+\t\t</body>
+\t</text>
+</TEI>
+"""
+
+
+def test_annotate_sessions_batches_across_sessions(tmp_path, monkeypatch):
+    import annotate
+
+    pipeline = _StubAnnotationPipeline()
+    monkeypatch.setattr(annotate, "get_annotation_pipeline", lambda: pipeline)
+    session_files = []
+    for name, session_id in (("ParlaMint-BA_T07S1", "ParlaMint-BA_T07.S1"),
+                             ("ParlaMint-BA_T07S2", "ParlaMint-BA_T07.S2")):
+        session_files.append(tmp_path / f"{name}.xml")
+        session_files[-1].write_text(SESSION.format(name=name, id=session_id),
+                                     encoding="utf-8")
+    outdir = tmp_path / "ana"
+    outdir.mkdir()
+
+    written = annotate.annotate_sessions(session_files, outdir, batch_size=3)
+
+    assert [f.name for f in written] == ["ParlaMint-BA_T07S1.ana.xml",
+                                         "ParlaMint-BA_T07S2.ana.xml"]
+    # The first batch ends in the second session; the line break is annotated
+    # as a space:
+    assert pipeline.calls == [
+        "Dobar dan, Sarajevo!\n\nPrvi red drugi red.\n\nDobar dan, Sarajevo!",
+        "Prvi red drugi red."]
+    assert not list(outdir.glob("*.tmp"))
+    ana = written[1].read_text(encoding="utf-8")
+    assert 'xml:id="ParlaMint-BA_T07S2.ana"' in ana
+    # Words are counted again, as `w`:
+    assert '<measure unit="words" quantity="7" xml:lang="bs">7 riječi</measure>' in ana
+    assert '<measure unit="words" quantity="7" xml:lang="en">7 words</measure>' in ana
+    for tag, occurs in (("w", 7), ("pc", 3), ("name", 1)):
+        assert f'\t\t\t<tagUsage gi="{tag}" occurs="{occurs}"/>\n' in ana
+    assert '<w xml:id="ParlaMint-BA_T07.S2.u1.s0.2" lemma="dan" msd="UPosTag=X" ' \
+        'ana="mte:X" join="right">dan</w>' in ana
+    assert '<name type="LOC">' in ana
+    assert "\t\t\t\t</seg>\n\t\t\t\t<seg" in ana and "</u>" in ana
@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("openpyxl")  # the synthetic MP/party workbooks
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_failing_worker_start_is_recorded(tmp_path, capsys, max_workers):
+    from build import build_sessions, report_failures
+    from synthetic import generate_corpus
+
+    paths = generate_corpus(tmp_path / "corpus", terms=(7,), sessions_per_term=2,
+                            utterances_per_session=5)
+    # The index can't be opened, so every worker fails in `init_worker`:
+    results = build_sessions(paths["datadir"], tmp_path / "S", paths["mp"],
+                             paths["parties"], max_workers=max_workers,
+                             index_path=tmp_path / "missing" / "index.sqlite",
+                             splitter="rules")
+
+    assert len(results) == 2
+    # A pool only reports that it broke; the worker logs the cause:
+    expected = "OperationalError" if max_workers == 1 else "BrokenProcessPool"
+    assert all(expected in r["error"] for r in results)
+    report_failures(results)
+    assert "Built 0 of 2 sessions" in capsys.readouterr().out
+
+
+def test_missing_inputs_fail_their_session_only(tmp_path):
+    from build import build_sessions, find_sessions, output_name, session_paths
+    from synthetic import generate_corpus
+
+    paths = generate_corpus(tmp_path / "corpus", terms=(7,), sessions_per_term=2,
+                            utterances_per_session=5)
+    sessions = find_sessions(paths["datadir"])
+    session_paths(paths["datadir"], *sessions[0])[1].unlink()
+    missing = (7, "99", "sjednica")
+
+    results = build_sessions(paths["datadir"], tmp_path / "S", paths["mp"],
+                             paths["parties"], max_workers=1,
+                             sessions=sessions + [missing], splitter="rules",
+                             manifest_path=tmp_path / "manifest.json")
+
+    errors = {output_name(r["term"], r["session"], r["suffix"]): r["error"]
+              for r in results}
+    assert errors[output_name(*sessions[1])] is None
+    assert errors[output_name(*sessions[0])] is not None
+    assert errors[output_name(*missing)] is not None
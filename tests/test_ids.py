@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+
+from utils import correct_id, correct_ids
+
+IDS = [
+    "ParlaMint-RS_T4.S2.u2565",
+    "ParlaMint-ba_T7.S12n.u3",
+    "ParlaMint-BA_T10.S1_2.u5",
+    "ParlaMint-BA_T07.S003.u1",
+    "ParlaMint-BA_T8.S-1.u1",
+    "ParlaMint-BA_T8.S 5 .u1",
+    "ParlaMint-BA_T8.S+5.u1",
+    "ParlaMint-BA_T8.S5.u1.s0",
+    "ParlaMint-BA_T1.Sk.u9",
+]
+
+
+def test_correct_ids_matches_correct_id():
+    ids = pd.Series(IDS, index=range(10, 10 + len(IDS)))
+
+    corrected = correct_ids(ids)
+
+    assert corrected.tolist() == [correct_id(i) for i in IDS]
+    assert corrected.index.equals(ids.index)
+
+
+def test_correct_ids_on_arrow_arrays():
+    pa = pytest.importorskip("pyarrow")
+
+    corrected = correct_ids(pa.chunked_array([IDS[:4], IDS[4:]]))
+
+    assert corrected.to_pylist() == [correct_id(i) for i in IDS]
+
+
+def test_malformed_ids():
+    ids = pd.Series(["ParlaMint-BA_T7.S1.u1", "not an ID"])
+
+    with pytest.raises(ValueError, match="1 malformed IDs"):
+        correct_ids(ids)
+    assert correct_ids(ids, errors="coerce").isna().tolist() == [False, True]
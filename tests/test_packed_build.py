@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("openpyxl")  # the synthetic MP/party workbooks
+
+
+def test_packed_build_feeds_root_and_validator(tmp_path):
+    from build import build_sessions, report_failures
+    from metadata import MetadataStore
+    from packed import PackedSession, packed_path
+    from root_tei import build_root_TEI
+    from synthetic import generate_corpus
+    from validate import validate_corpus
+
+    paths = generate_corpus(tmp_path / "corpus", terms=(7, 8), sessions_per_term=2,
+                            utterances_per_session=30)
+    session_dir = tmp_path / "S"
+    results = build_sessions(paths["datadir"], session_dir, paths["mp"], paths["parties"],
+                             max_workers=1, splitter="rules", pack="gzip")
+    report_failures(results)
+    assert [r["error"] for r in results] == [None] * 4
+
+    for r in results:
+        with PackedSession(packed_path(r["out_file"], "gzip")) as session:
+            assert len(session.utterances) == r["stats"]["speeches"]
+
+    metadata = MetadataStore.from_files(paths["mp"], paths["parties"])
+    root = session_dir / "ParlaMint-BA.xml"
+    build_root_TEI(metadata.mpdf, metadata.partiesdf, None, session_dir,
+                   paths["template"], root, additional_persons=[])
+    assert root.read_text(encoding="utf-8").count("<xi:include") == 4
+
+    report = validate_corpus(session_dir, root, max_workers=1)
+    assert report["files"] == 4
+    assert report["valid"] == 4
@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip("openpyxl")  # the synthetic MP/party workbooks
+
+
+def test_terms_without_sessions_are_skipped(tmp_path):
+    from build import build_sessions, find_sessions
+    from metadata import MetadataStore
+    from root_tei import build_root_TEI
+    from synthetic import generate_corpus
+
+    paths = generate_corpus(tmp_path / "corpus", terms=(7, 8), sessions_per_term=1,
+                            utterances_per_session=5)
+    session_dir = tmp_path / "S"
+    sessions = [s for s in find_sessions(paths["datadir"]) if s[0] == 7]
+    results = build_sessions(paths["datadir"], session_dir, paths["mp"], paths["parties"],
+                             max_workers=1, sessions=sessions, splitter="rules")
+    assert [r["error"] for r in results] == [None]
+
+    metadata = MetadataStore.from_files(paths["mp"], paths["parties"])
+    root = session_dir / "ParlaMint-BA.xml"
+    skipped = build_root_TEI(metadata.mpdf, metadata.partiesdf, None, session_dir,
+                             paths["template"], root, additional_persons=[])
+
+    assert skipped == [8]
+    text = root.read_text(encoding="utf-8")
+    assert 'ana="#PS.7"' in text
+    assert "#PS.8" not in text
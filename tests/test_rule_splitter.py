@@ -0,0 +1,29 @@
+import pytest
+
+from rule_splitter import split_sentences_rules
+
+
+@pytest.mark.parametrize("text, sentences", [
+    # Abbreviations that never end a sentence, and ordinals:
+    ("Prof. dr. Ivić je došao 12. 3. 2020. godine.",
+     ["Prof. dr. Ivić je došao 12. 3. 2020. godine."]),
+    # Abbreviations that may, but not before a number:
+    ("Vidi čl. 5 zakona. Zatim d.o.o. Firma.",
+     ["Vidi čl. 5 zakona.", "Zatim d.o.o.", "Firma."]),
+    # Initials:
+    ("Tu je A. B. Marković.", ["Tu je A. B. Marković."]),
+    ("Tu je A.B. Marković sa nama.", ["Tu je A.B. Marković sa nama."]),
+    # Closing quotes and brackets stay with the sentence they end:
+    ('"Ne." Onda je otišao.', ['"Ne."', "Onda je otišao."]),
+    ("Rekao je »Ne!« Onda smo glasali.", ["Rekao je »Ne!«", "Onda smo glasali."]),
+    ("To (vidi gore.) Onda.", ["To (vidi gore.)", "Onda."]),
+    # Transcriber notes:
+    ("Hvala. /PAUZA/ Nastavljamo.", ["Hvala.", "/PAUZA/ Nastavljamo."]),
+    ("Hoćemo li ponoviti? ____________(?) /nije uključen mikrofon/",
+     ["Hoćemo li ponoviti?", "____________(?) /nije uključen mikrofon/"]),
+    ("Rekli su /nešto. Nejasno/ i otišli.", ["Rekli su /nešto. Nejasno/ i otišli."]),
+    # Sentences never cross line breaks:
+    ("Prvi red\ndrugi red.", ["Prvi red", "drugi red."]),
+])
+def test_split_sentences_rules(text, sentences):
+    assert split_sentences_rules(text) == sentences
@@ -0,0 +1,70 @@
+import pytest
+
+
+def test_build_caches_classla_splits_by_default(tmp_path, monkeypatch):
+    pytest.importorskip("openpyxl")  # the synthetic MP/party workbooks
+    import segmentation_cache
+    import utils
+    from build import CACHE_NAME, build_sessions
+    from segmentation_cache import SegmentationCache
+    from synthetic import generate_corpus, use_stub_pipeline
+
+    monkeypatch.setattr(utils, "pipeline", None, raising=False)
+    use_stub_pipeline()
+    monkeypatch.setattr(segmentation_cache, "get_model_version", lambda: "stub")
+    paths = generate_corpus(tmp_path / "corpus", terms=(7,), sessions_per_term=1,
+                            utterances_per_session=5)
+    outdir = tmp_path / "S"
+
+    results = build_sessions(paths["datadir"], outdir, paths["mp"], paths["parties"],
+                             max_workers=1)
+
+    assert [r["error"] for r in results] == [None]
+    with SegmentationCache(outdir / CACHE_NAME, model_version="stub") as cache:
+        assert cache.stats()["entries"] == results[0]["stats"]["dedup"]["segmented texts"]
+
+
+def test_hits_misses_and_running_size(tmp_path):
+    from segmentation_cache import SegmentationCache
+
+    with SegmentationCache(tmp_path / "cache.sqlite", model_version="v1") as cache:
+        assert cache.get_many(["Prvi. Drugi.", "Treći."]) == {}
+        cache.put_many({"Prvi. Drugi.": ["Prvi.", "Drugi."], "Treći.": ["Treći."]})
+        assert cache.get_many(["Prvi. Drugi.", "Četvrti."]) == {
+            "Prvi. Drugi.": ["Prvi.", "Drugi."]}
+        assert (cache.hits, cache.misses) == (1, 3)
+        # Storing a key again changes nothing:
+        cache.put("Treći.", ["Treći."])
+        stats = cache.stats()
+        assert stats["entries"] == 2
+        assert stats["bytes"] == len('["Prvi.", "Drugi."]'.encode()) + len('["Treći."]'.encode())
+
+    # Other model versions don't see the splits, the same one after reopening does:
+    with SegmentationCache(tmp_path / "cache.sqlite", model_version="v2") as cache:
+        assert cache.get("Treći.") is None
+    with SegmentationCache(tmp_path / "cache.sqlite", model_version="v1") as cache:
+        assert cache.get("Treći.") == ["Treći."]
+        assert cache.size() == stats["bytes"]
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    import segmentation_cache
+    from segmentation_cache import SegmentationCache
+
+    clock = iter(range(1000))
+    monkeypatch.setattr(segmentation_cache.time, "time", lambda: float(next(clock)))
+
+    entry = len('["a"]')
+    with SegmentationCache(tmp_path / "cache.sqlite", model_version="v1",
+                           max_bytes=2 * entry, touch_batch=1) as cache:
+        cache.put("a", ["a"])
+        cache.put("b", ["b"])
+        # Touched, so `b` is the least recently used:
+        assert cache.get("a") == ["a"]
+        cache.put("c", ["c"])
+
+        assert cache.get("b") is None
+        assert cache.get("a") == ["a"] and cache.get("c") == ["c"]
+        # The triggers kept the running size in step with the table:
+        assert cache.size() == 2 * entry == cache._connection.execute(
+            "SELECT SUM(size) FROM segments").fetchone()[0]
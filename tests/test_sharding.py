@@ -0,0 +1,47 @@
+def test_shared_id_goes_to_every_session(tmp_path):
+    from sharding import shard_term
+    from utils import parse_meta_file, parse_text_file
+
+    (tmp_path / "T07_meta.tsv").write_text(
+        "Term\tSession\tID\tSpeaker\n"
+        "7\t1. sjdenica\tu1\tA\n"
+        "7\t1. sjdenica\tu2\tB\n"
+        "7\t2. sjednica\tu2\tB\n"
+        "7\t2. sjednica\tu3\tC\n",
+        encoding="utf-8")
+    (tmp_path / "T07_text.txt").write_text("u1 Prvi.\nu2 Drugi.\nu3 Treći.\n",
+                                           encoding="utf-8")
+    outdir = tmp_path / "S_data"
+    outdir.mkdir()
+
+    written = shard_term(tmp_path / "T07_meta.tsv", tmp_path / "T07_text.txt", outdir)
+
+    assert [f.name for f in written] == ["meta_T07_S1. sjednica.tsv",
+                                         "meta_T07_S2. sjednica.tsv"]
+    texts = [parse_text_file(f.with_name(f.name.replace("meta", "text")
+                                         .replace("tsv", "txt")))
+             for f in written]
+    assert [list(t.ID) for t in texts] == [["u1", "u2"], ["u2", "u3"]]
+    assert list(texts[1].Text) == ["Drugi.", "Treći."]
+    assert list(parse_meta_file(written[1]).ID) == ["u2", "u3"]
+
+
+def test_sessions_with_the_same_fixed_name_are_merged(tmp_path):
+    from sharding import shard_term
+    from utils import parse_meta_file, parse_text_file
+
+    (tmp_path / "T07_meta.tsv").write_text(
+        "Term\tSession\tID\tSpeaker\n"
+        "7\t1. sjdenica\tu1\tA\n"
+        "7\t1. sjednica\tu2\tB\n"
+        "7\t1. sjednica\tu1\tA\n",
+        encoding="utf-8")
+    (tmp_path / "T07_text.txt").write_text("u1 Prvi.\nu2 Drugi.\n", encoding="utf-8")
+    outdir = tmp_path / "S_data"
+    outdir.mkdir()
+
+    written = shard_term(tmp_path / "T07_meta.tsv", tmp_path / "T07_text.txt", outdir)
+
+    assert [f.name for f in written] == ["meta_T07_S1. sjednica.tsv"]
+    assert list(parse_meta_file(written[0]).ID) == ["u1", "u2"]
+    assert list(parse_text_file(outdir / "text_T07_S1. sjednica.txt").ID) == ["u1", "u2"]
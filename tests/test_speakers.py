@@ -0,0 +1,55 @@
+import pytest
+
+from speakers import SpeakerRegistry, reference_name
+
+PERSONS = ["LučićMiloš", "JovićNedeljko", "DžonsonRasel", "ĐurićAna"]
+
+
+@pytest.fixture
+def registry():
+    return SpeakerRegistry(PERSONS, ignored=["Protocol", "Predstavnik"])
+
+
+@pytest.mark.parametrize("name, person_id, match", [
+    ("LučićMiloš", "LučićMiloš", "exact"),
+    ("Lučić, Miloš", "LučićMiloš", "exact"),
+    ("DžonsonRasel(lord)", "DžonsonRasel", "exact"),
+    ("LucicMilos", "LučićMiloš", "diacritics"),
+    ("DjuricAna", "ĐurićAna", "diacritics"),
+    ("LučićMilosh", "LučićMiloš", "fuzzy"),
+    ("LučićMiloš;JovićNedeljko", "LučićMiloš", "joint exact"),
+    ("NepoznatiGovornik;JovicNedeljko", "JovićNedeljko", "joint diacritics"),
+    ("NepoznatiGovornik", None, None),
+])
+def test_match(registry, name, person_id, match):
+    assert registry.match(name) == (person_id, match)
+    assert registry.resolve(name) == person_id
+
+
+def test_ignored_and_unresolved(registry):
+    assert registry.ignores("Protocol")
+    assert registry.unresolved(["Protocol", "NepoznatiGovornik", "LučićMiloš",
+                                "NepoznatiGovornik"]) == ["NepoznatiGovornik"]
+
+
+def test_reference_name():
+    assert reference_name("Lučić, Miloš") == "LučićMiloš"
+    assert reference_name("Kovač – Horvat, Ana") == "Kovač-HorvatAna"
+
+
+def test_guessed_speakers_add_up():
+    from utils import SessionStats
+
+    first, second = SessionStats(), SessionStats()
+    first.guessed_speaker("LučićMilosh", "LučićMiloš", "fuzzy")
+    first.guessed_speaker("LučićMilosh", "LučićMiloš", "fuzzy")
+    second.guessed_speaker("LučićMilosh", "LučićMiloš", "fuzzy")
+    second.guessed_speaker("LučićMiloš;JovićNedeljko", "LučićMiloš", "joint exact")
+
+    first += SessionStats.from_dict(second.to_dict())
+
+    assert first.guessed_speakers == {
+        "LučićMilosh": {"id": "LučićMiloš", "match": "fuzzy", "utterances": 3},
+        "LučićMiloš;JovićNedeljko": {"id": "LučićMiloš", "match": "joint exact",
+                                     "utterances": 1},
+    }
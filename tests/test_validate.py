@@ -0,0 +1,30 @@
+import pytest
+
+SESSION = """<TEI xmlns="http://www.tei-c.org/ns/1.0" xml:id="{name}">
+  <teiHeader>
+    <tagUsage gi="text" occurs="1"/>
+    <tagUsage gi="body" occurs="1"/>
+    <tagUsage gi="u" occurs="{occurs}"/>
+    <tagUsage gi="seg" occurs="1"/>
+  </teiHeader>
+  <text><body>
+    <u xml:id="ParlaMint-BA_T07.S1.u1"><seg xml:id="ParlaMint-BA_T07.S1.u1.s0">Dobar dan.</seg></u>
+  </body></text>
+</TEI>
+"""
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_validator_errors_are_reported_per_file(tmp_path, max_workers):
+    from validate import validate_corpus
+
+    for name, occurs in (("ParlaMint-BA_T07S1", "1"), ("ParlaMint-BA_T07S2", "one")):
+        (tmp_path / f"{name}.xml").write_text(SESSION.format(name=name, occurs=occurs),
+                                              encoding="utf-8")
+
+    report = validate_corpus(tmp_path, max_workers=max_workers)
+
+    assert report["files"] == 2
+    assert report["valid"] == 1
+    assert report["error_counts"] == {"validator error": 1}
+    assert report["invalid_files"][0]["file"] == "ParlaMint-BA_T07S2.xml"
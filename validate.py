@@ -0,0 +1,287 @@
+"""Validates emitted session files against the root TEI, in parallel.
+
+Every `ParlaMint-BA_T*.xml` is streamed with `iterparse` on a process pool
+and checked for:
+
+- `TEI/@xml:id` matching the file name and being unique in the corpus,
+- unique `xml:id`s within the file,
+- `u` IDs of the session's term and `seg` IDs numbered `<u id>.s0`, `.s1`, ...,
+- `who` pointing to a person and `ana`/`corresp` to an ID of the root TEI
+  (categories only if the root defines or includes its taxonomies),
+- `tagUsage` and `extent` in the header agreeing with the text (words are
+  the `w` elements in annotated files).
+
+The report is JSON, see `validate_corpus`.
+
+Example:
+    python validate.py /home/rupnik/parlamint/BiH/S --root /home/rupnik/parlamint/BiH/S/ParlaMint-BA.xml --out validation.json
+"""
+import argparse
+import json
+import re
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, FrozenSet, List, Optional, Tuple, Union
+
+TEI_NAMESPACE = "{http://www.tei-c.org/ns/1.0}"
+XI_NAMESPACE = "{http://www.w3.org/2001/XInclude}"
+XML_ID = "{http://www.w3.org/XML/1998/namespace}id"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+SESSION_GLOB = "ParlaMint-BA_T*.xml"
+
+_U_ID = re.compile(r"ParlaMint-BA_T(?P<term>\d{2})\.S[^.]+\.u\d+")
+_FILE_TERM = re.compile(r"ParlaMint-BA_T(?P<term>\d{2})S")
+
+# Loaded once per worker by `_init_worker`:
+_worker_state: Dict = {}
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def read_root_ids(root_path: Union[str, Path]) -> Tuple[FrozenSet[str], FrozenSet[str], bool]:
+    """Collects the IDs sessions may point to from the root TEI.
+
+    Included files other than sessions (e.g. taxonomies) are read too, if
+    they exist next to the root.
+
+    Returns:
+        Tuple[FrozenSet[str], FrozenSet[str], bool]: person IDs, all IDs and
+            whether any `category` was found.
+    """
+    from xml.etree.ElementTree import iterparse
+
+    root_path = Path(root_path)
+    persons, ids, has_categories = set(), set(), False
+    to_read = [root_path]
+    while to_read:
+        path = to_read.pop()
+        for event, element in iterparse(str(path), events=("end",)):
+            tag = _local_name(element.tag)
+            xml_id = element.get(XML_ID)
+            if xml_id is not None:
+                ids.add(xml_id)
+                if tag == "person":
+                    persons.add(xml_id)
+            has_categories |= tag == "category"
+            if element.tag == f"{XI_NAMESPACE}include":
+                included = root_path.parent / element.get("href", "")
+                if not included.match(SESSION_GLOB) and included.is_file():
+                    to_read.append(included)
+            if tag in ("person", "org", "category", "event"):
+                element.clear()
+    return frozenset(persons), frozenset(ids), has_categories
+
+
+def validate_session(path: Union[str, Path],
+                     person_ids: Optional[FrozenSet[str]] = None,
+                     known_ids: Optional[FrozenSet[str]] = None,
+                     check_ana: bool = True,
+                     max_errors: int = 100) -> Dict:
+    """Checks a single session file in one streaming pass.
+
+    Utterances are dropped from the tree once checked, so memory does not
+    grow with the size of the file (apart from the set of seen IDs).
+
+    Args:
+        path (Union[str, Path]): session file
+        person_ids (FrozenSet[str], optional): valid `who` targets; `who`,
+            `ana` and `corresp` are not checked if None.
+        known_ids (FrozenSet[str], optional): valid `ana`/`corresp` targets.
+        check_ana (bool, optional): check `ana`, which mostly points to
+            taxonomy categories. Defaults to True.
+        max_errors (int, optional): errors to list; all are counted in
+            `error_counts`. Defaults to 100.
+
+    Returns:
+        Dict: `file`, `id` of the TEI element, `errors` (`type`, `id`,
+            `message`), `error_counts` by type and the `counts` of the text.
+            A file the checks fail on gets a `validator error`.
+    """
+    from xml.etree.ElementTree import ParseError, iterparse
+
+    path = Path(path)
+    errors: List[Dict] = []
+    error_counts: Counter = Counter()
+
+    def error(kind: str, xml_id: Optional[str], message: str) -> None:
+        error_counts[kind] += 1
+        if len(errors) < max_errors:
+            errors.append({"type": kind, "id": xml_id, "message": message})
+
+    def check_refs(element, attribute: str, targets: FrozenSet[str]) -> None:
+        for ref in element.get(attribute, "").split():
+            if ref.startswith("#") and ref[1:] not in targets:
+                error(f"unknown {attribute}", element.get(XML_ID),
+                      f"{_local_name(element.tag)}/@{attribute} {ref} not in the root TEI")
+
+    match = _FILE_TERM.match(path.name)
+    term = match.group("term") if match else None
+    seen, counts, declared, measures = set(), Counter(), {}, []
+    words, stack, in_text, tei_id = 0, [], False, None
+    try:
+        for event, element in iterparse(str(path), events=("start", "end")):
+            tag = _local_name(element.tag)
+            if event == "start":
+                in_text |= tag == "text"
+                if in_text:
+                    counts[tag] += 1
+                stack.append(element)
+                continue
+            stack.pop()
+            xml_id = element.get(XML_ID)
+            if xml_id is not None:
+                if xml_id in seen:
+                    error("duplicate xml:id", xml_id, f"{tag}/@xml:id {xml_id} is not unique")
+                seen.add(xml_id)
+            if person_ids is not None:
+                if check_ana:
+                    check_refs(element, "ana", known_ids)
+                check_refs(element, "corresp", known_ids)
+            if tag == "TEI":
+                tei_id = xml_id
+                if xml_id != path.stem:
+                    error("TEI id", xml_id,
+                          f"TEI/@xml:id {xml_id} does not match file name {path.name}")
+            elif tag == "tagUsage":
+                declared[element.get("gi")] = int(element.get("occurs", -1))
+            elif tag == "measure":
+                measures.append((element.get("unit"), element.get("quantity"),
+                                 element.get(XML_LANG)))
+            elif tag == "seg":
+                if len(element):
+                    # Annotated, count the tokens:
+                    words += sum(1 for _ in element.iter(f"{TEI_NAMESPACE}w"))
+                else:
+                    words += len((element.text or "").split())
+            elif tag == "u":
+                match = _U_ID.fullmatch(xml_id or "")
+                if match is None or match.group("term") != term:
+                    error("u id", xml_id, f"u/@xml:id {xml_id} does not match the session")
+                if person_ids is not None:
+                    check_refs(element, "who", person_ids)
+                for i, seg in enumerate(element.iter(f"{TEI_NAMESPACE}seg")):
+                    seg_id = seg.get(XML_ID)
+                    if seg_id != f"{xml_id}.s{i}":
+                        error("seg id", seg_id, f"seg/@xml:id {seg_id} should be {xml_id}.s{i}")
+                element.clear()
+                if stack:
+                    stack[-1].remove(element)
+    except ParseError as e:
+        error("not well-formed", None, str(e))
+    except Exception as e:
+        # E.g. a malformed `tagUsage/@occurs`, reported rather than raised so
+        # the other files' results are kept:
+        error("validator error", None, f"{type(e).__name__}: {e}")
+
+    if "not well-formed" not in error_counts and "validator error" not in error_counts:
+        for gi in sorted(set(declared) | set(counts)):
+            if declared.get(gi, 0) != counts.get(gi, 0):
+                error("tagUsage", gi, f"tagUsage for {gi} says {declared.get(gi)}, "
+                      f"the text has {counts.get(gi, 0)}")
+        actual = {"speeches": counts.get("u", 0), "words": words}
+        for unit, quantity, lang in measures:
+            if unit in actual and quantity != str(actual[unit]):
+                error("extent", unit, f"{unit} measure ({lang}) says {quantity}, "
+                      f"the text has {actual[unit]}")
+    return {"file": path.name, "id": tei_id, "errors": errors,
+            "error_counts": dict(error_counts),
+            "counts": {"u": counts.get("u", 0), "seg": counts.get("seg", 0),
+                       "words": words}}
+
+
+def _init_worker(person_ids, known_ids, check_ana) -> None:
+    _worker_state.update(person_ids=person_ids, known_ids=known_ids,
+                         check_ana=check_ana)
+
+
+def _validate_in_worker(path: Union[str, Path], max_errors: int) -> Dict:
+    return validate_session(path, max_errors=max_errors, **_worker_state)
+
+
+def validate_corpus(session_dir: Union[str, Path],
+                    root_path: Optional[Union[str, Path]] = None,
+                    max_workers: int = 8, max_errors: int = 100) -> Dict:
+    """Validates all session files in a directory on a process pool.
+
+    Args:
+        session_dir (Union[str, Path]): directory with `ParlaMint-BA_T*.xml`
+        root_path (Union[str, Path], optional): root TEI for the reference
+            checks. Defaults to `ParlaMint-BA.xml` in `session_dir`, if it
+            exists; without it references are not checked.
+        max_workers (int, optional): number of processes. Defaults to 8.
+        max_errors (int, optional): errors listed per file. Defaults to 100.
+
+    Returns:
+        Dict: `files`, `valid` files, `error_counts` by type over the
+            corpus, which checks ran and the per-file results of
+            `validate_session` for files with errors.
+    """
+    start = perf_counter()
+    session_dir = Path(session_dir)
+    if root_path is None and (session_dir / "ParlaMint-BA.xml").exists():
+        root_path = session_dir / "ParlaMint-BA.xml"
+    person_ids = known_ids = None
+    check_ana = False
+    if root_path is not None:
+        person_ids, known_ids, check_ana = read_root_ids(root_path)
+    files = sorted(session_dir.glob(SESSION_GLOB))
+    # Biggest first, so no big file is left running alone at the end:
+    files.sort(key=lambda f: f.stat().st_size, reverse=True)
+
+    initargs = (person_ids, known_ids, check_ana)
+    if max_workers <= 1:
+        _init_worker(*initargs)
+        results = [_validate_in_worker(f, max_errors) for f in files]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=initargs) as executor:
+            results = list(executor.map(_validate_in_worker, files,
+                                        [max_errors] * len(files), chunksize=4))
+
+    tei_ids = Counter(r["id"] for r in results)
+    for r in results:
+        if r["id"] is not None and tei_ids[r["id"]] > 1:
+            r["error_counts"]["duplicate TEI id"] = 1
+            r["errors"].append({"type": "duplicate TEI id", "id": r["id"],
+                                "message": f"TEI/@xml:id {r['id']} is used by several files"})
+
+    error_counts = Counter()
+    for r in results:
+        error_counts.update(r["error_counts"])
+    invalid = sorted((r for r in results if r["error_counts"]),
+                     key=lambda r: r["file"])
+    return {
+        "root": str(root_path) if root_path is not None else None,
+        "files": len(results),
+        "valid": len(results) - len(invalid),
+        "error_counts": dict(error_counts),
+        "checked": {"references": person_ids is not None, "ana": check_ana},
+        "seconds": perf_counter() - start,
+        "invalid_files": invalid,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("session_dir")
+    parser.add_argument("--root", default=None)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-errors", type=int, default=100,
+                        help="errors listed per file, all are counted")
+    parser.add_argument("--out", default=None, help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    report = validate_corpus(args.session_dir, args.root, args.workers, args.max_errors)
+    if args.out is None:
+        print(json.dumps(report, indent=1, ensure_ascii=False))
+    else:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1, ensure_ascii=False)
+        print(f"{report['valid']} of {report['files']} files valid, "
+              f"{sum(report['error_counts'].values())} errors.")
+    sys.exit(1 if report["error_counts"] else 0)